@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Benchmark del camino de render de usage_bar.py
+
+Genera un árbol ~/.claude/projects sintético en un HOME temporal y mide por
+separado claude_usage_bar(), parse_jsonl_tokens() y calculate_session_reset(),
+con cache frío y caliente. Reporta p50/p95/p99 y el pico de RSS, y guarda los
+resultados en JSON para comparar entre commits.
+
+Uso:
+    python3 bench_usage_bar.py
+    python3 bench_usage_bar.py --projects 50 --sessions 40 --sizes 64K,4M,256M
+    python3 bench_usage_bar.py --output nuevo.json --compare viejo.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS = ("claude_usage_bar", "parse_jsonl_tokens", "calculate_session_reset")
+SCENARIOS = ("cold", "warm")
+MODEL = {"id": "claude-sonnet-4-5", "display_name": "Claude Sonnet 4.5"}
+
+def parse_size(text):
+    """Convierte "64K", "4M", "1G" o "512" a bytes"""
+    text = text.strip().upper()
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def format_size(size):
+    """Inverso aproximado de parse_size para nombres y reportes"""
+    for unit, factor in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+# --- Generación del árbol sintético ---
+
+def _user_line(index):
+    return json.dumps({
+        "type": "user",
+        "timestamp": f"2025-01-01T{index // 3600 % 24:02d}:{index // 60 % 60:02d}:{index % 60:02d}Z",
+        "message": {"role": "user", "content": f"mensaje de prueba {index}"},
+    }) + "\n"
+
+def _assistant_line(index):
+    return json.dumps({
+        "type": "assistant",
+        "timestamp": f"2025-01-01T{index // 3600 % 24:02d}:{index // 60 % 60:02d}:{index % 60:02d}Z",
+        "requestId": f"req_{index:012d}",
+        "message": {
+            "id": f"msg_{index:012d}",
+            "model": MODEL["id"],
+            "role": "assistant",
+            "content": [{"type": "text", "text": "respuesta " * 20}],
+            "usage": {
+                "input_tokens": 12,
+                "output_tokens": 340,
+                "cache_creation_input_tokens": 1500,
+                "cache_read_input_tokens": 42000,
+            },
+        },
+    }) + "\n"
+
+def _tool_result_line(index, size):
+    return json.dumps({
+        "type": "user",
+        "timestamp": "2025-01-01T00:00:00Z",
+        "message": {
+            "role": "user",
+            "content": [{"type": "tool_result", "tool_use_id": f"toolu_{index}", "content": "x" * size}],
+        },
+    }) + "\n"
+
+def write_session(path, target_size, tool_result_size, tool_result_every):
+    """Escribe un JSONL de ~target_size bytes con turnos user/assistant"""
+    written = 0
+    index = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target_size:
+            chunk = _user_line(index) + _assistant_line(index)
+            if tool_result_size and tool_result_every and index % tool_result_every == tool_result_every - 1:
+                chunk += _tool_result_line(index, min(tool_result_size, max(target_size - written, 1)))
+            f.write(chunk)
+            written += len(chunk)
+            index += 1
+
+def generate_tree(home, args):
+    """
+    Crea projects × sessions transcripts chicos de relleno y una sesión
+    objetivo por cada tamaño pedido. Retorna {tamaño: session_id}
+    """
+    projects_dir = os.path.join(home, ".claude", "projects")
+    filler = parse_size(args.filler_size)
+    for p in range(args.projects):
+        project_dir = os.path.join(projects_dir, f"-home-bench-project-{p:04d}")
+        os.makedirs(project_dir, exist_ok=True)
+        for s in range(args.sessions):
+            write_session(os.path.join(project_dir, f"filler-{p:04d}-{s:04d}.jsonl"), filler, 0, 0)
+
+    targets = {}
+    target_dir = os.path.join(projects_dir, "-home-bench-target")
+    os.makedirs(target_dir, exist_ok=True)
+    for size_text in args.sizes.split(","):
+        size = parse_size(size_text)
+        session_id = f"bench-target-{format_size(size)}"
+        write_session(
+            os.path.join(target_dir, f"{session_id}.jsonl"),
+            size,
+            parse_size(args.tool_result_size),
+            args.tool_result_every,
+        )
+        targets[format_size(size)] = session_id
+    return targets
+
+# --- Worker: corre en un proceso propio para medir RSS por escenario ---
+
+def _drop_page_cache(path):
+    """Saca el archivo del page cache (si el sistema lo permite)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except (AttributeError, OSError):
+        pass
+
+def _reset_state(usage_bar):
+    """Borra el estado en disco y en memoria de usage_bar (cache frío)"""
+    shutil.rmtree(usage_bar.get_state_path(), ignore_errors=True)
+    for name, value in (("_SESSION_INDEX", None), ("_WEB_CACHE", (None, None))):
+        if hasattr(usage_bar, name):
+            setattr(usage_bar, name, value)
+    for name in ("_CHECKPOINTS", "_SEEN_MESSAGES"):
+        if hasattr(usage_bar, name):
+            getattr(usage_bar, name).clear()
+
+def run_worker(spec):
+    """Mide una función en un escenario; imprime el resultado como JSON"""
+    sys.path.insert(0, REPO_DIR)
+    import usage_bar
+
+    session_id = spec["session_id"]
+    payload = json.dumps({"session_id": session_id, "model": MODEL})
+    session = usage_bar.find_session(session_id)
+    jsonl_path = session["path"]
+
+    def call():
+        if spec["function"] == "claude_usage_bar":
+            sys.stdin = io.StringIO(payload)
+            return usage_bar.claude_usage_bar()
+        if spec["function"] == "parse_jsonl_tokens":
+            return usage_bar.parse_jsonl_tokens(jsonl_path)
+        return usage_bar.calculate_session_reset(session_id)
+
+    cold = spec["scenario"] == "cold"
+    if not cold:
+        call()
+
+    samples = []
+    for _ in range(spec["iterations"]):
+        if cold:
+            _reset_state(usage_bar)
+            _drop_page_cache(jsonl_path)
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+
+    print(json.dumps({
+        "function": spec["function"],
+        "scenario": spec["scenario"],
+        "size": spec["size"],
+        "iterations": len(samples),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(samples[-1], 3),
+        "peak_rss_kb": peak_rss,
+    }))
+
+# --- Reporte ---
+
+def _result_key(result):
+    return (result["function"], result["scenario"], result["size"])
+
+def print_report(results, baseline=None):
+    """Tabla de resultados; con baseline agrega la variación del p50"""
+    previous = {_result_key(r): r for r in (baseline or {}).get("results", [])}
+    header = f"{'función':<24} {'escenario':<9} {'tamaño':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}"
+    if previous:
+        header += f" {'Δp50':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        line = (f"{r['function']:<24} {r['scenario']:<9} {r['size']:>7} "
+                f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                f"{r['peak_rss_kb'] / 1024:>8.1f}")
+        old = previous.get(_result_key(r))
+        if old and old["p50_ms"]:
+            line += f" {(r['p50_ms'] / old['p50_ms'] - 1) * 100:>+7.0f}%"
+        print(line)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del render de usage_bar.py")
+    parser.add_argument("--projects", type=int, default=20, help="proyectos de relleno")
+    parser.add_argument("--sessions", type=int, default=20, help="sesiones de relleno por proyecto")
+    parser.add_argument("--filler-size", default="16K", help="tamaño de cada sesión de relleno")
+    parser.add_argument("--sizes", default="64K,1M,16M", help="tamaños de las sesiones medidas (ej: 64K,16M,256M)")
+    parser.add_argument("--tool-result-size", default="2M", help="tamaño de las líneas de tool_result")
+    parser.add_argument("--tool-result-every", type=int, default=50, help="un tool_result cada N turnos (0 = nunca)")
+    parser.add_argument("--iterations", type=int, default=30, help="mediciones por escenario")
+    parser.add_argument("--functions", default=",".join(FUNCTIONS), help="funciones a medir")
+    parser.add_argument("--output", default="bench_results.json", help="archivo JSON de resultados")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--keep", action="store_true", help="no borrar el HOME temporal")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        return 0
+
+    home = tempfile.mkdtemp(prefix="usage-bar-bench-")
+    try:
+        print(f"Generando árbol sintético en {home} ...", file=sys.stderr)
+        targets = generate_tree(home, args)
+
+        env = dict(os.environ, HOME=home)
+        results = []
+        for function in args.functions.split(","):
+            for size, session_id in targets.items():
+                for scenario in SCENARIOS:
+                    spec = {
+                        "function": function, "scenario": scenario, "size": size,
+                        "session_id": session_id, "iterations": args.iterations,
+                    }
+                    print(f"  {function} {scenario} {size}", file=sys.stderr)
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                        env=env, capture_output=True, text=True, check=True,
+                    )
+                    results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    finally:
+        if args.keep:
+            print(f"HOME temporal conservado en {home}", file=sys.stderr)
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {k: v for k, v in vars(args).items() if k not in ("worker", "compare", "output", "keep")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nResultados guardados en {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -41,12 +41,12 @@ echo ""
 
 # Copiar script
 echo -e "${YELLOW}[3/5]${NC} Copiando script de status bar..."
-if [ -f "usage_bar.py" ]; then
-    cp usage_bar.py ~/.claude-code/scripts/
-    chmod +x ~/.claude-code/scripts/usage_bar.py
-    echo -e "${GREEN}✓ Script copiado y permisos configurados${NC}"
+if [ -f "usage_bar.py" ] && [ -f "usage_bar_client.py" ] && [ -f "usage_snapshot.py" ]; then
+    cp usage_bar.py usage_bar_client.py usage_snapshot.py ~/.claude-code/scripts/
+    chmod +x ~/.claude-code/scripts/usage_bar.py ~/.claude-code/scripts/usage_bar_client.py ~/.claude-code/scripts/usage_snapshot.py
+    echo -e "${GREEN}✓ Scripts copiados y permisos configurados${NC}"
 else
-    echo -e "${RED}✗ No se encontró usage_bar.py en el directorio actual${NC}"
+    echo -e "${RED}✗ No se encontró usage_bar.py, usage_bar_client.py o usage_snapshot.py en el directorio actual${NC}"
     echo "Asegúrate de ejecutar este script desde el directorio Claude-Status-Bar"
     exit 1
 fi
@@ -54,7 +54,7 @@ echo ""
 
 # Probar script
 echo -e "${YELLOW}[4/5]${NC} Probando el script..."
-TEST_OUTPUT=$(echo '{"current_tokens": 450000, "expected_total_tokens": 500000, "model": {"id": "claude-sonnet-4-5", "display_name": "Claude Sonnet 4.5"}}' | python3 ~/.claude-code/scripts/usage_bar.py)
+TEST_OUTPUT=$(echo '{"current_tokens": 450000, "expected_total_tokens": 500000, "model": {"id": "claude-sonnet-4-5", "display_name": "Claude Sonnet 4.5"}}' | python3 ~/.claude-code/scripts/usage_bar_client.py)
 
 if [ -n "$TEST_OUTPUT" ]; then
     echo -e "${GREEN}✓ Script funciona correctamente${NC}"
@@ -93,8 +93,13 @@ if [ -f "$SETTINGS_FILE" ]; then
             echo ""
             echo '  "statusLine": {'
             echo '    "type": "command",'
-            echo '    "command": "python3 ~/.claude-code/scripts/usage_bar.py",'
+            echo '    "command": "python3 ~/.claude-code/scripts/usage_bar_client.py",'
             echo '    "padding": 0'
+            echo '  },'
+            echo '  "hooks": {'
+            echo '    "SessionStart": ['
+            echo '      {"hooks": [{"type": "command", "command": "python3 ~/.claude-code/scripts/usage_bar.py --prewarm"}]}'
+            echo '    ]'
             echo '  }'
             exit 0
         fi
@@ -116,10 +121,18 @@ with open(settings_file, 'r') as f:
 
 settings['statusLine'] = {
     "type": "command",
-    "command": "python3 ~/.claude-code/scripts/usage_bar.py",
+    "command": "python3 ~/.claude-code/scripts/usage_bar_client.py",
     "padding": 0
 }
 
+# Hook SessionStart: precalienta el estado antes del primer render
+# (sin duplicarlo si el instalador ya corrió antes)
+prewarm = "python3 ~/.claude-code/scripts/usage_bar.py --prewarm"
+session_start = settings.setdefault('hooks', {}).setdefault('SessionStart', [])
+if not any(hook.get('command') == prewarm
+           for entry in session_start for hook in entry.get('hooks', [])):
+    session_start.append({"hooks": [{"type": "command", "command": prewarm}]})
+
 with open(settings_file, 'w') as f:
     json.dump(settings, f, indent=2)
     f.write('\n')
@@ -133,8 +146,20 @@ else
 {
   "statusLine": {
     "type": "command",
-    "command": "python3 ~/.claude-code/scripts/usage_bar.py",
+    "command": "python3 ~/.claude-code/scripts/usage_bar_client.py",
     "padding": 0
+  },
+  "hooks": {
+    "SessionStart": [
+      {
+        "hooks": [
+          {
+            "type": "command",
+            "command": "python3 ~/.claude-code/scripts/usage_bar.py --prewarm"
+          }
+        ]
+      }
+    ]
   }
 }
 EOF
@@ -154,6 +179,9 @@ echo ""
 echo -e "${BLUE}Ejemplo de salida:${NC}"
 echo "  [████████████░░░░░░░░] 45% Reset: Today 15:00"
 echo ""
+echo -e "${BLUE}Opcional: el mismo uso en tmux (sin volver a calcularlo):${NC}"
+echo "  set -g status-right '#(python3 ~/.claude-code/scripts/usage_snapshot.py --max-age 900)'"
+echo ""
 echo -e "${YELLOW}Si tienes problemas:${NC}"
 echo "  - Lee la sección de troubleshooting en README.md"
 echo "  - Ejecuta: python3 ~/.claude-code/scripts/usage_bar.py (manual)"
@@ -8,6 +8,7 @@ echo ""
 GREEN='\033[0;32m'
 BLUE='\033[0;34m'
 YELLOW='\033[1;33m'
+RED='\033[0;31m'
 NC='\033[0m' # No Color
 
 # Test 1: Sonnet 4.5 con 45% de uso
@@ -55,6 +56,894 @@ echo -e "${BLUE}Test 9: Sin stdin - debería retornar vacío${NC}"
 echo '' | python3 usage_bar.py
 echo ""
 
+# --- Pruebas automáticas (HOME temporal, no tocan tu configuración) ---
+FAILURES=0
+check() {
+    # check <descripción> <condición>
+    if eval "$2"; then
+        echo -e "${GREEN}✓ $1${NC}"
+    else
+        echo -e "${RED}✗ $1${NC}"
+        FAILURES=$((FAILURES + 1))
+    fi
+}
+
+TEST_HOME=$(mktemp -d)
+mkdir -p "$TEST_HOME/.claude" "$TEST_HOME/stub"
+echo '{"claudeAiOauth": {"accessToken": "test-token"}}' > "$TEST_HOME/.claude/.credentials.json"
+echo '<div>42% used</div><div>Resets in 2 hr 10 min</div>' > "$TEST_HOME/stub/usage.html"
+
+# Servidor HTTP local que simula claude.ai/settings/usage
+# (cada request queda registrada en $TEST_HOME/stub.log)
+start_stub() {
+    STUB_PORT=$(python3 -c 'import socket; s=socket.socket(); s.bind(("127.0.0.1", 0)); print(s.getsockname()[1])')
+    python3 -m http.server "$STUB_PORT" --bind 127.0.0.1 --directory "$TEST_HOME/stub" 2>"$TEST_HOME/stub.log" >/dev/null &
+    STUB_PID=$!
+    sleep 0.5
+}
+start_stub
+trap 'kill $STUB_PID 2>/dev/null; rm -rf "$TEST_HOME"' EXIT
+
+run_bar() {
+    echo '{"session_id": "none", "model": {"id": "claude-sonnet-4-5"}}' | \
+        HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:$STUB_PORT/usage.html" "$@" python3 "${BAR_SCRIPT:-usage_bar.py}"
+}
+
+echo -e "${BLUE}Test 10: Cache web stale-while-revalidate contra servidor local${NC}"
+OUTPUT=$(run_bar env)
+check "Sin cache el render no espera la red" '[[ "$OUTPUT" == *"Claude Code"* ]]'
+for _ in $(seq 20); do
+    [ -f "$TEST_HOME/.claude-code/usage-cache.json" ] && break
+    sleep 0.1
+done
+check "El refresco en segundo plano escribe el cache" '[ -f "$TEST_HOME/.claude-code/usage-cache.json" ]'
+OUTPUT=$(run_bar env)
+check "Render con cache fresco muestra 42%" '[[ "$OUTPUT" == *"42%"* ]]'
+
+kill $STUB_PID 2>/dev/null
+touch -d '-5 minutes' "$TEST_HOME/.claude-code/usage-cache.json"
+rm -f "$TEST_HOME/.claude-code/usage-cache.refreshing"
+OUTPUT=$(run_bar env)
+check "Cache vencido se sirve igual sin esperar la red" '[[ "$OUTPUT" == *"42%"* ]]'
+OUTPUT=$(run_bar env CLAUDE_STATUSBAR_MAX_STALENESS=120)
+check "Pasado el máximo de antigüedad se usa el cálculo local" '[[ "$OUTPUT" != *"42%"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 11: Presupuesto de arranque (python -X importtime)${NC}"
+# Render con cache fresco: no debe importar módulos pesados y el total de
+# imports debe quedar bajo STARTUP_BUDGET_US microsegundos. Se mide también
+# usage_bar_client.py, que es el statusLine que configura install.sh (sin
+# daemon cae al render en proceso, así que cubre ambos caminos)
+touch "$TEST_HOME/.claude-code/usage-cache.json"
+for BAR_SCRIPT in usage_bar.py usage_bar_client.py; do
+    IMPORT_REPORT=$(BAR_SCRIPT=$BAR_SCRIPT run_bar env PYTHONPROFILEIMPORTTIME=1 2>&1 >/dev/null | \
+        STARTUP_BUDGET_US="${STARTUP_BUDGET_US:-60000}" python3 -c '
+import os, sys
+heavy = {"subprocess", "shutil", "pathlib", "datetime", "socket", "socketserver", "threading", "concurrent"}
+total = 0
+found = []
+for line in sys.stdin:
+    parts = line.split("|")
+    if len(parts) != 3 or not parts[1].strip().isdigit():
+        continue
+    name = parts[2].rstrip()
+    if not name.startswith("  "):
+        total += int(parts[1])
+    if name.strip() in heavy:
+        found.append(name.strip())
+budget = int(os.environ["STARTUP_BUDGET_US"])
+print(total, budget, ",".join(found) or "-")
+')
+    read IMPORT_US IMPORT_BUDGET IMPORT_HEAVY <<< "$IMPORT_REPORT"
+    echo "  $BAR_SCRIPT: imports ${IMPORT_US}us (presupuesto ${IMPORT_BUDGET}us), módulos pesados: $IMPORT_HEAVY"
+    check "$BAR_SCRIPT no importa módulos pesados en el camino rápido" '[ "$IMPORT_HEAVY" = "-" ]'
+    check "$BAR_SCRIPT: tiempo de imports dentro del presupuesto" '[ "$IMPORT_US" -le "$IMPORT_BUDGET" ]'
+done
+unset BAR_SCRIPT
+echo ""
+
+echo -e "${BLUE}Test 12: Un solo fetch con renders concurrentes (single-flight)${NC}"
+start_stub
+touch -d '-5 minutes' "$TEST_HOME/.claude-code/usage-cache.json"
+for _ in $(seq 8); do
+    run_bar env > "$TEST_HOME/render.$RANDOM.out" &
+done
+wait $(jobs -p | grep -v "^$STUB_PID$")
+for _ in $(seq 30); do
+    [ $(( $(date +%s) - $(stat -c %Y "$TEST_HOME/.claude-code/usage-cache.json") )) -lt 60 ] && break
+    sleep 0.1
+done
+sleep 1
+FETCHES=$(grep -c 'GET /usage.html' "$TEST_HOME/stub.log")
+check "8 renders concurrentes con cache vencido producen exactamente 1 fetch ($FETCHES)" '[ "$FETCHES" -eq 1 ]'
+check "El refresco usa un request condicional (304 Not Modified)" 'grep -q "GET /usage.html HTTP/1.1\" 304" "$TEST_HOME/stub.log"'
+check "Todos los renders sirvieron el valor anterior" '[ $(cat "$TEST_HOME"/render.*.out | grep -c "42%") -eq 8 ]'
+kill $STUB_PID 2>/dev/null
+echo ""
+
+echo -e "${BLUE}Test 13: Tablero --top con redibujado incremental${NC}"
+TOP_DIR="$TEST_HOME/.claude/projects/-home-test-top"
+mkdir -p "$TOP_DIR"
+echo '{"type":"assistant","message":{"model":"claude-sonnet-4-5","usage":{"input_tokens":1000,"output_tokens":500}}}' > "$TOP_DIR/top-session-1.jsonl"
+echo '{"type":"assistant","message":{"model":"claude-opus-4","usage":{"input_tokens":2000,"output_tokens":0}}}' > "$TOP_DIR/top-session-2.jsonl"
+HOME="$TEST_HOME" timeout -s INT 3.5 python3 usage_bar.py --top 1 > "$TEST_HOME/top.out" 2>&1
+check "Lista las dos sesiones" 'grep -q "top-sess.*1,500" "$TEST_HOME/top.out" && grep -q "top-sess.*2,000" "$TEST_HOME/top.out"'
+check "Sin cambios, solo se redibuja la cabecera" '[ $(grep -o "top-sess" "$TEST_HOME/top.out" | wc -l) -eq 2 ]'
+check "Restaura la pantalla al salir" 'grep -q "?1049l" "$TEST_HOME/top.out"'
+echo ""
+
+echo -e "${BLUE}Test 14: Presupuesto de latencia (CLAUDE_STATUSBAR_BUDGET_MS)${NC}"
+BUDGET_DIR="$TEST_HOME/.claude/projects/-home-test-budget"
+mkdir -p "$BUDGET_DIR"
+python3 -c '
+import json, sys
+line = json.dumps({"type": "assistant", "message": {"usage": {"input_tokens": 1, "output_tokens": 1}}, "pad": "x" * 200}) + "\n"
+sys.stdout.write(line * 100000)
+' > "$BUDGET_DIR/budget-session.jsonl"
+rm -f "$TEST_HOME/.claude-code/usage-cache.json" "$TEST_HOME/.claude-code/budget-overruns.json"
+BUDGET_INPUT='{"session_id":"budget-session","model":{"id":"claude-sonnet-4-5"}}'
+# Sesión ya indexada: el deadline corta la lectura del transcript
+HOME="$TEST_HOME" python3 -c 'import usage_bar; usage_bar.find_session("budget-session")'
+BUDGET_OUT=$(echo "$BUDGET_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_BUDGET_MS=2 python3 usage_bar.py)
+echo "  $BUDGET_OUT"
+check "Con el deadline vencido el porcentaje se marca como viejo (≈)" '[[ "$BUDGET_OUT" == *"≈"* ]]'
+check "La demora queda registrada en budget-overruns.json" 'grep -q "token_parse" "$TEST_HOME/.claude-code/budget-overruns.json"'
+FULL_OUT=$(echo "$BUDGET_INPUT" | HOME="$TEST_HOME" python3 usage_bar.py)
+check "Sin presupuesto el parseo continúa y termina (11%)" '[[ "$FULL_OUT" == *"11%"* && "$FULL_OUT" != *"≈"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 15: Instrumentación opcional y --stats${NC}"
+rm -f "$TEST_HOME/.claude-code/statusbar-debug.json" "$TEST_HOME/.claude-code/profile.bin"
+echo "$BUDGET_INPUT" | HOME="$TEST_HOME" python3 usage_bar.py > /dev/null
+check "Por defecto no se escribe statusbar-debug.json ni profile.bin" '[ ! -e "$TEST_HOME/.claude-code/statusbar-debug.json" ] && [ ! -e "$TEST_HOME/.claude-code/profile.bin" ]'
+for _ in 1 2 3; do
+    echo "$BUDGET_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_PROFILE=1 python3 usage_bar.py > /dev/null
+done
+STATS_OUT=$(HOME="$TEST_HOME" python3 usage_bar.py --stats)
+echo "$STATS_OUT" | sed 's/^/  /'
+check "--stats reporta cada etapa de los 3 renders" 'echo "$STATS_OUT" | grep -q "^token_parse *3 " && echo "$STATS_OUT" | grep -q "^stdin *3 "'
+# El transcript no tiene timestamps: eso queda en el índice y los renders
+# siguientes no lo vuelven a leer entero buscando el inicio de la sesión
+count_start_reads() {
+    HOME="$TEST_HOME" python3 -c '
+import usage_bar
+reads = []
+original = usage_bar._read_first_timestamp
+def counting(path):
+    reads.append(path)
+    return original(path)
+usage_bar._read_first_timestamp = counting
+start = usage_bar.get_session_start("budget-session")
+print(start, len(reads))
+'
+}
+START_READS=$(count_start_reads)
+check "Sin timestamps el resultado negativo se guarda por (inodo, tamaño)" '[ "$START_READS" = "None 0" ] && grep -q "no_start" "$TEST_HOME/.claude-code/session-index.json"'
+echo '{"type":"assistant","timestamp":"2025-01-01T10:00:00Z","message":{"usage":{"input_tokens":1,"output_tokens":1}}}' >> "$BUDGET_DIR/budget-session.jsonl"
+START_READS=$(count_start_reads)
+check "Si el transcript cambia se vuelve a buscar el inicio" '[ "$START_READS" = "1735725600.0 1" ]'
+echo ""
+
+echo -e "${BLUE}Test 16: Campos de stdin como última fuente${NC}"
+rm -f "$TEST_HOME/.claude-code/usage-cache.json"
+STDIN_OUT=$(echo '{"session_id":"sin-transcript","current_tokens":340000,"model":{"id":"claude-sonnet-4-5"}}' | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+echo "  $STDIN_OUT"
+check "Sin web ni transcript se usa current_tokens (20%)" '[[ "$STDIN_OUT" == *"20%"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 17: Un mensaje repetido en varias líneas se cuenta una vez${NC}"
+DUP_DIR="$TEST_HOME/.claude/projects/-home-test-dup"
+mkdir -p "$DUP_DIR"
+DUP_LINE='{"type":"assistant","message":{"id":"msg_dup1","role":"assistant","usage":{"input_tokens":170000,"output_tokens":0}},"requestId":"req_dup1"}'
+printf '%s\n%s\n' "$DUP_LINE" "$DUP_LINE" > "$DUP_DIR/dup-session.jsonl"
+DUP_INPUT='{"session_id":"dup-session","model":{"id":"claude-sonnet-4-5"}}'
+DUP_OUT=$(echo "$DUP_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+check "Dos líneas del mismo mensaje suman 10%, no 20%" '[[ "$DUP_OUT" == *"10%"* ]]'
+# Otra copia en una pasada incremental posterior (ids persistidos en el .ids)
+echo "$DUP_LINE" >> "$DUP_DIR/dup-session.jsonl"
+echo '{"type":"assistant","message":{"id":"msg_dup2","role":"assistant","usage":{"input_tokens":170000,"output_tokens":0}},"requestId":"req_dup2"}' >> "$DUP_DIR/dup-session.jsonl"
+DUP_OUT=$(echo "$DUP_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+check "La deduplicación sigue entre pasadas incrementales (20%)" '[[ "$DUP_OUT" == *"20%"* ]]'
+DUP_IDS="$TEST_HOME/.claude-code/checkpoints/dup-session.ids"
+check "El .ids se guarda ordenado (se usa sin ordenar al cargarlo)" 'python3 -c "
+import sys
+from array import array
+ids = array(\"Q\", open(sys.argv[1], \"rb\").read())
+sys.exit(not (len(ids) == 2 and list(ids) == sorted(ids)))
+" "$DUP_IDS"'
+# Un .ids que no coincide con el checkpoint (escrito sin su checkpoint) no
+# se usa: se reescanea desde el inicio en vez de contar de nuevo un mensaje
+head -c 8 "$DUP_IDS" > "$DUP_IDS.tmp" && mv "$DUP_IDS.tmp" "$DUP_IDS"
+echo "$DUP_LINE" >> "$DUP_DIR/dup-session.jsonl"
+DUP_OUT=$(echo "$DUP_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+check "Con el .ids inconsistente se reescanea (sigue en 20%)" '[[ "$DUP_OUT" == *"20%"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 18: Reporte desde el almacén columnar${NC}"
+REPORT_OUT=$(HOME="$TEST_HOME" python3 usage_bar.py report --by project --no-numpy)
+echo "$REPORT_OUT" | sed 's/^/  /'
+check "Los 3 renglones de 2 mensajes cuentan 2 mensajes" 'echo "$REPORT_OUT" | grep -q "^-home-test-dup  *2 "'
+check "Hay un archivo por columna" '[ -f "$TEST_HOME/.claude-code/warehouse/timestamp.d" ] && [ -f "$TEST_HOME/.claude-code/warehouse/cache_read_input_tokens.q" ]'
+echo '{"type":"assistant","message":{"id":"msg_dup3","role":"assistant","usage":{"input_tokens":5,"output_tokens":0}},"requestId":"req_dup3"}' >> "$DUP_DIR/dup-session.jsonl"
+REPORT_OUT=$(HOME="$TEST_HOME" python3 usage_bar.py report --by project --no-numpy)
+check "La ingesta incremental agrega solo la línea nueva" 'echo "$REPORT_OUT" | grep -q "^-home-test-dup  *3 "'
+echo ""
+
+echo -e "${BLUE}Test 19: Transcript comprimido (.jsonl.gz)${NC}"
+GZ_DIR="$TEST_HOME/.claude/projects/-home-test-gz"
+mkdir -p "$GZ_DIR"
+echo '{"type":"assistant","timestamp":"2025-01-01T10:00:00Z","message":{"id":"msg_gz1","role":"assistant","usage":{"input_tokens":340000,"output_tokens":0}},"requestId":"req_gz1"}' | gzip > "$GZ_DIR/gz-session.jsonl.gz"
+GZ_INPUT='{"session_id":"gz-session","model":{"id":"claude-sonnet-4-5"}}'
+GZ_OUT=$(echo "$GZ_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+echo "  $GZ_OUT"
+check "Los tokens del archivo comprimido cuentan (20%)" '[[ "$GZ_OUT" == *"20%"* ]]'
+check "El resumen queda en archive-totals.json" 'grep -q "gz-session.jsonl.gz" "$TEST_HOME/.claude-code/archive-totals.json"'
+# Cada proceso cuenta cuántas veces abre el .gz en modo block y en el almacén:
+# después de la primera pasada no se vuelve a descomprimir
+count_archive_opens() {
+    HOME="$TEST_HOME" python3 -c '
+import usage_bar
+opens = []
+original = usage_bar.open_transcript
+def counting(path):
+    if usage_bar.is_archived_transcript(path):
+        opens.append(path)
+    return original(path)
+usage_bar.open_transcript = counting
+usage_bar.get_active_block()
+usage_bar.ingest_usage_warehouse()
+print(len(opens))
+'
+}
+GZ_OPENS_FIRST=$(count_archive_opens)
+GZ_OPENS_AGAIN="$(count_archive_opens) $(count_archive_opens)"
+echo "  Aperturas del .gz: primera pasada $GZ_OPENS_FIRST, siguientes $GZ_OPENS_AGAIN"
+check "Block y report no vuelven a descomprimir el archivo" '[ "$GZ_OPENS_AGAIN" = "0 0" ]'
+echo ""
+
+echo -e "${BLUE}Test 20: Precalentamiento desde el hook SessionStart (--prewarm)${NC}"
+# El transcript queda fuera de las raíces de proyectos: solo se encuentra
+# por el transcript_path que envía el hook
+PREWARM_DIR="$TEST_HOME/elsewhere"
+mkdir -p "$PREWARM_DIR"
+echo '{"type":"assistant","timestamp":"2025-01-01T10:00:00Z","message":{"id":"msg_pw1","role":"assistant","usage":{"input_tokens":1234,"output_tokens":0}},"requestId":"req_pw1"}' > "$PREWARM_DIR/pw-session.jsonl"
+PREWARM_OUT=$(echo "{\"session_id\":\"pw-session\",\"transcript_path\":\"$PREWARM_DIR/pw-session.jsonl\",\"hook_event_name\":\"SessionStart\"}" | \
+    HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py --prewarm)
+check "El hook no imprime nada" '[ -z "$PREWARM_OUT" ]'
+for _ in $(seq 30); do
+    [ -f "$TEST_HOME/.claude-code/checkpoints/pw-session.json" ] && break
+    sleep 0.1
+done
+check "Se siembra el checkpoint de tokens" 'grep -q "1234" "$TEST_HOME/.claude-code/checkpoints/pw-session.json"'
+check "El índice guarda la ruta y el inicio de la sesión" 'python3 -c "
+import json, sys
+s = json.load(open(sys.argv[1]))[\"sessions\"][\"pw-session\"]
+sys.exit(not (s[\"path\"].endswith(\"pw-session.jsonl\") and s[\"start\"] == 1735725600))
+" "$TEST_HOME/.claude-code/session-index.json"'
+echo ""
+
+echo -e "${BLUE}Test 21: Snapshot mmap para consumidores externos (usage_snapshot.py)${NC}"
+echo '{"session_id":"snap-session","current_tokens":450000,"model":{"id":"claude-sonnet-4-5"}}' | \
+    HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py >/dev/null
+SNAP_OUT=$(HOME="$TEST_HOME" python3 usage_snapshot.py --format '{percentage}% {tokens}/{limit} {session}')
+echo "  $SNAP_OUT"
+check "El lector muestra el estado del último render" '[ "$SNAP_OUT" = "26% 450000/1700000 snap-ses" ]'
+check "El snapshot tiene tamaño fijo (112 bytes)" '[ "$(wc -c < "$TEST_HOME/.claude-code/status.snap")" -eq 112 ]'
+SNAP_OLD=$(sleep 1.1; HOME="$TEST_HOME" python3 usage_snapshot.py --max-age 1)
+check "Con --max-age un snapshot viejo no imprime nada" '[ -z "$SNAP_OLD" ]'
+echo ""
+
+echo -e "${BLUE}Test 22: Checkpoint incremental ante truncado, reescritura y línea parcial${NC}"
+CK_FILE="$TEST_HOME/elsewhere/ck-session.jsonl"
+ck_line() {
+    echo "{\"type\":\"assistant\",\"requestId\":\"req_$1\",\"message\":{\"id\":\"msg_$1\",\"usage\":{\"input_tokens\":$2,\"output_tokens\":1}}}"
+}
+# Cada llamada es un proceso nuevo: retoma desde el checkpoint en disco
+ck_tokens() {
+    HOME="$TEST_HOME" python3 -c 'import sys, usage_bar; print(*usage_bar.parse_jsonl_tokens_incremental(sys.argv[1], "ck-session")[:2])' "$CK_FILE"
+}
+{ ck_line 1 5; ck_line 2 5; ck_line 3 5; } > "$CK_FILE"
+CK_FIRST=$(ck_tokens)
+# Truncado en el lugar (mismo inode) y vuelto a crecer más allá del offset
+: > "$CK_FILE"
+{ ck_line 4 2; ck_line 5 2; ck_line 6 2; ck_line 7 9; } >> "$CK_FILE"
+CK_REGROWN=$(ck_tokens)
+check "Truncado y vuelto a crecer: se reescanea (15 4)" '[ "$CK_FIRST" = "15 3" ] && [ "$CK_REGROWN" = "15 4" ]'
+# Reescritura en el lugar del mismo tamaño: otros números, mismo largo
+sleep 0.05
+CK_CONTENT=$(sed 's/"input_tokens":9/"input_tokens":8/' "$CK_FILE")
+printf '%s\n' "$CK_CONTENT" 1<> "$CK_FILE"
+CK_REWRITTEN=$(ck_tokens)
+check "Reescrito con el mismo tamaño: se reescanea (14 4)" '[ "$CK_REWRITTEN" = "14 4" ]'
+# Última línea a medio escribir: no se cuenta hasta que se completa
+CK_PARTIAL_LINE=$(ck_line 8 100)
+printf '%s' "${CK_PARTIAL_LINE:0:30}" >> "$CK_FILE"
+CK_PARTIAL=$(ck_tokens)
+printf '%s\n' "${CK_PARTIAL_LINE:30}" >> "$CK_FILE"
+CK_COMPLETED=$(ck_tokens)
+check "Línea parcial: se cuenta una vez, al completarse" '[ "$CK_PARTIAL" = "14 4" ] && [ "$CK_COMPLETED" = "114 5" ]'
+echo ""
+
+echo -e "${BLUE}Test 23: usage_bar_v2.py lee el transcript desde el último offset${NC}"
+V2_FILE="$TEST_HOME/elsewhere/v2-session.jsonl"
+v2_line() {
+    echo "{\"type\":\"assistant\",\"message\":{\"usage\":{\"input_tokens\":$1,\"output_tokens\":5}}}"
+}
+v2_bar() {
+    echo "{\"transcript_path\":\"$1\",\"model\":{\"id\":\"claude-sonnet-4-5\"}}" | \
+        HOME="$TEST_HOME" python3 usage_bar_v2.py | grep -o '[0-9]*%'
+}
+{ v2_line 300000; echo '{"type":"user","message":{"content":"hola"}}'; } > "$V2_FILE"
+V2_FIRST=$(v2_bar "$V2_FILE")
+V2_LINE=$(v2_line 100000)
+printf '%s' "${V2_LINE:0:40}" >> "$V2_FILE"
+V2_PARTIAL=$(v2_bar "$V2_FILE")
+printf '%s\n' "${V2_LINE:40}" >> "$V2_FILE"
+V2_GROWN=$(v2_bar "$V2_FILE")
+check "JSONL: 30%, línea parcial sin contar, 40% al completarse" '[ "$V2_FIRST $V2_PARTIAL $V2_GROWN" = "30% 30% 40%" ]'
+check "El cache guarda el offset del JSONL" 'grep -q "\"offset\": $(wc -c < "$V2_FILE")" "$TEST_HOME/.claude-code/v2-transcript-cache.json"'
+echo '{"messages": [{"inputTokens": 450000, "outputTokens": 10}, {"inputTokens": 50000}]}' > "$TEST_HOME/elsewhere/v2-legacy.json"
+check "Transcript JSON ({\"messages\": [...]}): 50%" '[ "$(v2_bar "$TEST_HOME/elsewhere/v2-legacy.json")" = "50%" ]'
+v2_line 100000 | sed 's/"output_tokens"/"cache_read_input_tokens":900000,"output_tokens"/' >> "$V2_FILE"
+check "cache_read no se suma en cada turno (50%, no 140%)" '[ "$(v2_bar "$V2_FILE")" = "50%" ]'
+V2_STREAM=$(HOME="$TEST_HOME" python3 -c '
+import io, json, os, sys, tracemalloc
+import usage_bar_v2
+messages = [{"inputTokens": index, "outputTokens": 1, "text": "x" * 40} for index in range(100000)]
+with open(sys.argv[1], "w") as f:
+    json.dump({"version": 1, "meta": {"title": "a"}, "messages": messages}, f, indent=1)
+expected = (sum(m["inputTokens"] for m in messages), len(messages))
+del messages
+# Bloques chicos: claves, strings y números cortados entre dos lecturas
+usage_bar_v2.JSON_CHUNK_CHARS = 7
+short = {"meta": [1, {"a": "b"}], "messages": [{"inputTokens": 12345, "outputTokens": 678}] * 50}
+small = usage_bar_v2.walk_json_messages(io.StringIO(json.dumps(short))) == (617250, 33900)
+usage_bar_v2.JSON_CHUNK_CHARS = 1 << 16
+tracemalloc.start()
+with open(sys.argv[1], encoding="utf-8") as f:
+    walked = usage_bar_v2.walk_json_messages(f)
+peak = tracemalloc.get_traced_memory()[1]
+print(walked == expected, small, peak < os.path.getsize(sys.argv[1]) // 10)
+' "$TEST_HOME/elsewhere/v2-big.json" 2>&1)
+check "JSON grande: mismos totales, bloques cortados y memoria acotada" '[ "$V2_STREAM" = "True True True" ]'
+V2_PRUNED=$(HOME="$TEST_HOME" python3 -c '
+import json, os, usage_bar_v2
+usage_bar_v2.save_transcript_cache({f"/t/{i}": {"mtime_ns": i} for i in range(100)})
+cache = usage_bar_v2.load_transcript_cache()
+print(len(cache), min(entry["mtime_ns"] for entry in cache.values()))
+')
+check "El cache de v2 conserva los 64 transcripts más recientes" '[ "$V2_PRUNED" = "64 36" ]'
+echo ""
+
+echo -e "${BLUE}Test 24: Modo block: chunks de un mensaje repartidos entre dos renders${NC}"
+BLOCK_DIR="$TEST_HOME/.claude/projects/-home-test-block"
+mkdir -p "$BLOCK_DIR"
+BLOCK_TS=$(date -u +%Y-%m-%dT%H:%M:%SZ)
+block_line() {
+    echo "{\"type\":\"assistant\",\"timestamp\":\"$BLOCK_TS\",\"requestId\":\"req_$1\",\"message\":{\"id\":\"msg_$1\",\"role\":\"assistant\",\"usage\":{\"input_tokens\":$2,\"output_tokens\":10}}}"
+}
+# Cada llamada es un render nuevo: retoma desde block-cache.json
+block_tokens() {
+    HOME="$TEST_HOME" python3 -c 'import usage_bar; block = usage_bar.get_active_block(); print(block[1] if block else 0)'
+}
+BLOCK_BEFORE=$(block_tokens)
+block_line split 1000 > "$BLOCK_DIR/block-session.jsonl"
+BLOCK_FIRST=$(block_tokens)
+block_line split 1000 >> "$BLOCK_DIR/block-session.jsonl"
+BLOCK_SECOND=$(block_tokens)
+block_line other 495 >> "$BLOCK_DIR/block-session.jsonl"
+BLOCK_THIRD=$(block_tokens)
+echo "  Tokens del bloque: $BLOCK_BEFORE → $BLOCK_FIRST → $BLOCK_SECOND → $BLOCK_THIRD"
+check "El segundo chunk del mismo mensaje no suma" '[ $((BLOCK_FIRST - BLOCK_BEFORE)) -eq 1010 ] && [ "$BLOCK_SECOND" -eq "$BLOCK_FIRST" ]'
+check "Un mensaje nuevo sí suma" '[ $((BLOCK_THIRD - BLOCK_SECOND)) -eq 505 ]'
+# Con el cache web al día el porcentaje es el de claude.ai, pero el reset
+# sigue siendo el fin del bloque activo (no el inicio de la sesión + 5 h)
+echo '{"percentage": 42}' > "$TEST_HOME/.claude-code/usage-cache.json"
+BLOCK_WEB_OUT=$(echo '{"session_id": "none", "model": {"id": "claude-sonnet-4-5"}}' | \
+    HOME="$TEST_HOME" CLAUDE_STATUSBAR_MODE=block CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+rm -f "$TEST_HOME/.claude-code/usage-cache.json"
+BLOCK_END=$(python3 -c 'import sys, time; start = int(sys.argv[1]); print(time.strftime("%H:%M", time.localtime(start - start % 3600 + 5 * 3600)))' "$(date -u -d "$BLOCK_TS" +%s)")
+echo "  $BLOCK_WEB_OUT"
+check "Con datos de claude.ai el reset es el fin del bloque ($BLOCK_END)" '[[ "$BLOCK_WEB_OUT" == *"42%"*"Resets: $BLOCK_END"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 25: Daemon con watcher de inotify (CLAUDE_STATUSBAR_WATCH=1)${NC}"
+rm -f "$TEST_HOME/.claude-code/usage-cache.json"
+WATCH_DIR="$TEST_HOME/.claude/projects/-home-test-watch"
+mkdir -p "$WATCH_DIR"
+watch_line() {
+    echo "{\"type\":\"assistant\",\"requestId\":\"req_$1\",\"message\":{\"id\":\"msg_$1\",\"usage\":{\"input_tokens\":$2,\"output_tokens\":0}}}"
+}
+watch_line w1 170000 > "$WATCH_DIR/watch-session.jsonl"
+# Transcript fuera de las raíces vigiladas, registrado por el hook de prewarm
+watch_line o1 170000 > "$TEST_HOME/elsewhere/outside-session.jsonl"
+HOME="$TEST_HOME" python3 usage_bar.py --prewarm-session outside-session "$TEST_HOME/elsewhere/outside-session.jsonl"
+HOME="$TEST_HOME" CLAUDE_STATUSBAR_WATCH=1 CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py --daemon &
+DAEMON_PID=$!
+for _ in $(seq 30); do
+    [ -S "$TEST_HOME/.claude-code/usage_bar.sock" ] && break
+    sleep 0.1
+done
+client_bar() {
+    echo "{\"session_id\":\"$1\",\"model\":{\"id\":\"claude-sonnet-4-5\"}}" | \
+        HOME="$TEST_HOME" python3 usage_bar_client.py | grep -o '[0-9]*%'
+}
+WATCH_FIRST="$(client_bar watch-session) $(client_bar outside-session)"
+watch_line w2 340000 >> "$WATCH_DIR/watch-session.jsonl"
+watch_line o2 340000 >> "$TEST_HOME/elsewhere/outside-session.jsonl"
+sleep 0.5
+WATCH_SECOND="$(client_bar watch-session) $(client_bar outside-session)"
+kill $DAEMON_PID 2>/dev/null
+wait $DAEMON_PID 2>/dev/null
+echo "  vigilada / fuera de las raíces: $WATCH_FIRST → $WATCH_SECOND"
+check "Transcript vigilado: el watcher actualiza los totales (10% → 30%)" '[ "${WATCH_FIRST% *} ${WATCH_SECOND% *}" = "10% 30%" ]'
+check "Transcript no vigilado: se relee del checkpoint (10% → 30%)" '[ "${WATCH_FIRST#* } ${WATCH_SECOND#* }" = "10% 30%" ]'
+echo ""
+
+echo -e "${BLUE}Test 26: report --by day en husos de media hora y de 45 minutos${NC}"
+# 18:20Z y 18:40Z caen a ambos lados de la medianoche en +05:30;
+# 15:05Z y 15:25Z, a ambos lados en +08:45
+report_days() {
+    TZ="$1" python3 -c '
+import sys
+from array import array
+import usage_bar
+stamps = [float(value) for value in sys.argv[1:]]
+columns = {name: array(code, [0] * len(stamps)) for name, code in usage_bar.WAREHOUSE_COLUMNS}
+columns["timestamp"] = array("d", stamps)
+columns["input_tokens"] = array("q", [1] * len(stamps))
+manifest = {"dictionaries": {"project": [], "session": [], "model": ["claude-sonnet-4-5"]}}
+report = usage_bar.aggregate_usage(columns, manifest, "day")
+print(" ".join("%s=%d" % (day, report[day]["messages"]) for day in sorted(report)))
+' "${@:2}"
+}
+DAY_KOLKATA=$(report_days Asia/Kolkata 1735755600 1735756800)
+DAY_EUCLA=$(report_days Australia/Eucla 1735743900 1735745100)
+echo "  Asia/Kolkata: $DAY_KOLKATA, Australia/Eucla: $DAY_EUCLA"
+check "+05:30: 23:50 y 00:10 locales van a días distintos" '[ "$DAY_KOLKATA" = "2025-01-01=1 2025-01-02=1" ]'
+check "+08:45: 23:50 y 00:10 locales van a días distintos" '[ "$DAY_EUCLA" = "2025-01-01=1 2025-01-02=1" ]'
+echo ""
+
+echo -e "${BLUE}Test 27: Limpieza de los ring buffers de burn rate${NC}"
+BURN_STATE="$TEST_HOME/.claude-code/burn"
+burn_sample() {
+    HOME="$TEST_HOME" python3 -c 'import sys, usage_bar; usage_bar.record_burn_sample(sys.argv[1], 100)' "$1"
+}
+burn_sample burn-old
+burn_sample burn-recent
+touch -d '-1 hour' "$BURN_STATE/burn-old.bin"
+burn_sample burn-new
+check "Al crear un buffer se borran los de sesiones inactivas" '[ ! -e "$BURN_STATE/burn-old.bin" ]'
+check "Los buffers con muestras en la ventana se conservan" '[ -e "$BURN_STATE/burn-recent.bin" ] && [ -e "$BURN_STATE/burn-new.bin" ]'
+echo ""
+
+echo -e "${BLUE}Test 28: Cliente liviano: render en el daemon y fallback en proceso${NC}"
+# Solo el daemon tiene CLAUDE_STATUSBAR_PROFILE=1: si el render pasó por él,
+# profile.bin crece; si el cliente renderizó en su proceso, no
+PROFILE_BIN="$TEST_HOME/.claude-code/profile.bin"
+CLIENT_SOCK="$TEST_HOME/.claude-code/usage_bar.sock"
+CLIENT_INPUT='{"session_id":"dup-session","model":{"id":"claude-sonnet-4-5"}}'
+profile_size() {
+    stat -c %s "$PROFILE_BIN" 2>/dev/null || echo 0
+}
+client_render() {
+    echo "$CLIENT_INPUT" | HOME="$TEST_HOME" python3 usage_bar_client.py
+}
+IN_PROCESS_OUT=$(echo "$CLIENT_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py)
+HOME="$TEST_HOME" CLAUDE_STATUSBAR_PROFILE=1 CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py --daemon &
+DAEMON_PID=$!
+for _ in $(seq 30); do
+    [ -S "$CLIENT_SOCK" ] && break
+    sleep 0.1
+done
+PROFILE_BEFORE=$(profile_size)
+DAEMON_OUT=$(client_render)
+PROFILE_AFTER=$(profile_size)
+check "Con el daemon corriendo el render se hace en el daemon" '[ "$PROFILE_AFTER" -gt "$PROFILE_BEFORE" ]'
+echo "  $DAEMON_OUT"
+check "El daemon produce la misma barra que el render en proceso" '[ -n "$DAEMON_OUT" ] && [ "$DAEMON_OUT" = "$IN_PROCESS_OUT" ]'
+kill $DAEMON_PID 2>/dev/null
+wait $DAEMON_PID 2>/dev/null
+FALLBACK_OUT=$(CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" client_render)
+check "Sin socket el cliente renderiza en su proceso" '[ ! -e "$CLIENT_SOCK" ] && [ "$FALLBACK_OUT" = "$IN_PROCESS_OUT" ] && [ "$(profile_size)" -eq "$PROFILE_AFTER" ]'
+# Socket huérfano (daemon muerto sin limpiar): connect falla y también cae al fallback
+python3 -c 'import socket, sys; socket.socket(socket.AF_UNIX).bind(sys.argv[1])' "$CLIENT_SOCK"
+STALE_OUT=$(CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" client_render)
+rm -f "$CLIENT_SOCK"
+check "Con un socket huérfano también cae al render en proceso" '[ "$STALE_OUT" = "$IN_PROCESS_OUT" ]'
+echo ""
+
+echo -e "${BLUE}Test 29: Modo context: solo el último mensaje con usage (lectura desde el final)${NC}"
+CTX_DIR="$TEST_HOME/.claude/projects/-home-test-context"
+mkdir -p "$CTX_DIR"
+{
+    echo '{"type":"assistant","message":{"id":"msg_c1","usage":{"input_tokens":400000,"cache_read_input_tokens":300000,"output_tokens":10}}}'
+    echo '{"type":"assistant","message":{"id":"msg_c2","usage":{"input_tokens":100000,"cache_creation_input_tokens":50000,"cache_read_input_tokens":100000,"output_tokens":10}}}'
+    # Resultado de herramienta posterior que menciona "usage" dentro de un string
+    echo '{"type":"user","message":{"content":"el campo \"usage\" no cuenta acá"}}'
+} > "$CTX_DIR/ctx-session.jsonl"
+# Un mensaje a medio escribir al final
+printf '%s' '{"type":"assistant","message":{"id":"msg_c3","usage":{"input_tokens":9000' >> "$CTX_DIR/ctx-session.jsonl"
+CTX_INPUT='{"session_id":"ctx-session","model":{"id":"claude-sonnet-4-5"}}'
+ctx_bar() {
+    echo "$CTX_INPUT" | HOME="$TEST_HOME" CLAUDE_STATUSBAR_MODE=context CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 usage_bar.py | grep -o '[0-9]*%'
+}
+CTX_PARTIAL=$(ctx_bar)
+printf '%s\n' '00,"cache_read_input_tokens":0,"output_tokens":10}}}' >> "$CTX_DIR/ctx-session.jsonl"
+CTX_COMPLETED=$(ctx_bar)
+echo "  línea parcial: $CTX_PARTIAL, completa: $CTX_COMPLETED"
+check "Ocupación del contexto: input + cache del último mensaje completo (25% de 1M)" '[ "$CTX_PARTIAL" = "25%" ]'
+check "Al completarse la línea cuenta el mensaje nuevo (90%)" '[ "$CTX_COMPLETED" = "90%" ]'
+echo ""
+
+echo -e "${BLUE}Test 30: El camino rápido del parser da lo mismo que json.loads${NC}"
+FAST_OUT=$(HOME="$TEST_HOME" python3 -c '
+import json, sys
+import usage_bar
+
+big = "x" * (usage_bar.MAX_LINE_BYTES + 1000)
+usage = {"input_tokens": 11, "output_tokens": 7, "cache_creation_input_tokens": 3, "cache_read_input_tokens": 5}
+entries = [
+    # Compacto, como lo escribe Claude Code
+    {"type": "assistant", "message": {"id": "msg_f1", "usage": usage}},
+    # Con espacios y el usage antes del tipo
+    {"message": {"usage": {"output_tokens": 2, "input_tokens": 1}, "role": "assistant"}},
+    # "usage" e "input_tokens" dentro de un string (escapados)
+    {"type": "assistant", "message": {"content": "el \"usage\": {\"input_tokens\": 99}", "usage": {"input_tokens": 4}}},
+    # Ambiguo: un segundo bloque usage en la misma línea
+    {"type": "assistant", "message": {"usage": {"input_tokens": 8}}, "toolUseResult": {"usage": {"input_tokens": 1000}}},
+    # Línea de usuario con usage de otro objeto
+    {"type": "user", "usage": {"input_tokens": 6}, "toolUseResult": {"usage": {"output_tokens": 2000}}},
+    # Gigantes: usage al final, ambiguo y sin usage
+    {"type": "assistant", "message": {"content": big, "usage": usage}},
+    {"type": "assistant", "message": {"content": big, "usage": {"input_tokens": 9}}, "toolUseResult": {"usage": {"input_tokens": 3000}}},
+    {"type": "user", "message": {"content": big}},
+    # Gigantes con el usage al principio (solo en head): sin nada en la cola
+    # y con otro usage en la cola
+    {"type": "assistant", "message": {"usage": {"input_tokens": 13, "output_tokens": 1}, "content": big}},
+    {"type": "assistant", "message": {"usage": {"input_tokens": 17}, "content": big}, "toolUseResult": {"usage": {"input_tokens": 4000}}},
+    # Campo repetido (ambiguo)
+    {"type": "assistant", "message": {"usage": {"input_tokens": 2}, "content": [{"input_tokens": 50}]}},
+]
+path = sys.argv[1]
+with open(path, "w") as f:
+    for index, entry in enumerate(entries):
+        f.write(json.dumps(entry, separators=(",", ":") if index != 1 else None) + "\n")
+
+expected = [0, 0, 0, 0]
+for line in open(path, "rb"):
+    values = usage_bar._usage_from_entry(json.loads(line))
+    for index, name in enumerate(("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")):
+        expected[index] += values.get(name, 0)
+totals = [0, 0, 0, 0]
+with usage_bar.open_transcript(path) as f:
+    usage_bar.scan_jsonl_usage(f, 0, totals)
+print(expected == totals, expected, totals)
+' "$TEST_HOME/elsewhere/fast-path.jsonl")
+echo "  $FAST_OUT"
+check "Mismos totales con el prefiltro, la regex y las líneas gigantes" '[[ "$FAST_OUT" == True* ]]'
+echo ""
+
+echo -e "${BLUE}Test 31: Modo block: escaneo en paralelo y cache por archivo${NC}"
+# HOME aparte: el bloque suma todos los proyectos y acá se controla qué hay
+BLOCK_HOME="$TEST_HOME/block-home"
+mkdir -p "$BLOCK_HOME/.claude-code"
+PARALLEL_OUT=$(HOME="$BLOCK_HOME" python3 -c '
+import json, os, time
+import concurrent.futures
+import usage_bar
+
+pools = []
+class CountingPool(concurrent.futures.ProcessPoolExecutor):
+    def __init__(self, *args, **kwargs):
+        pools.append(1)
+        super().__init__(*args, **kwargs)
+concurrent.futures.ProcessPoolExecutor = CountingPool
+usage_bar.BLOCK_PARALLEL_MIN_FILES = 2
+usage_bar.BLOCK_PARALLEL_MIN_BYTES = 0
+
+def line(index, timestamp, tokens):
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+    return json.dumps({"type": "assistant", "timestamp": stamp, "requestId": f"req_b{index}",
+                       "message": {"id": f"msg_b{index}", "role": "assistant",
+                                   "usage": {"input_tokens": tokens, "output_tokens": 0}}}) + "\n"
+
+now = time.time()
+first = now - 2 * 3600
+paths = []
+for index, root in enumerate(usage_bar.get_project_roots() * 3):
+    directory = os.path.join(root, f"-home-block-{index}")
+    os.makedirs(directory, exist_ok=True)
+    paths.append(os.path.join(directory, f"block-{index}.jsonl"))
+    with open(paths[-1], "w") as f:
+        if index == 0:
+            # Bloque anterior: 6 horas antes del primero del bloque activo
+            f.write(line(100, first - 6 * 3600, 1000000))
+        f.write(line(index, first + index * 60, 100 * (index + 1)))
+
+start, tokens = usage_bar.get_active_block()
+results = [pools.count(1), start == first - first % 3600, tokens]
+
+# Segunda pasada en el mismo proceso: solo se lee lo agregado
+with open(paths[3], "a") as f:
+    f.write(line(50, now - 60, 5000))
+scans = []
+original = usage_bar.scan_block_entries
+def counting(path, offset, recent_ids=()):
+    scans.append((path, offset))
+    return original(path, offset, recent_ids)
+usage_bar.scan_block_entries = counting
+start, tokens = usage_bar.get_active_block()
+results += [len(scans), scans[0][1] == os.path.getsize(paths[3]) - len(line(50, now - 60, 5000)), tokens]
+
+# Proceso "nuevo" (cache desde disco): nada que releer, mismo resultado
+usage_bar._BLOCK_CACHE = None
+scans.clear()
+same = usage_bar.get_active_block() == (start, tokens)
+results += [len(scans), same]
+print(*results)
+')
+echo "  pools, inicio, tokens / lecturas, offset, tokens / lecturas, igual: $PARALLEL_OUT"
+check "Con 6 archivos en las dos raíces se escanea en paralelo (inicio y 2100 tokens)" '[ "$(echo $PARALLEL_OUT | cut -d" " -f1-3)" = "1 True 2100" ]'
+check "Lo agregado después se lee desde el offset guardado (7100 tokens)" '[ "$(echo $PARALLEL_OUT | cut -d" " -f4-6)" = "1 True 7100" ]'
+check "Con el cache en disco no se relee ningún archivo" '[ "$(echo $PARALLEL_OUT | cut -d" " -f7-8)" = "0 True" ]'
+echo ""
+
+echo -e "${BLUE}Test 32: Modo block: la cadena de bloques sigue entre renders${NC}"
+# 12 horas de actividad continua (un mensaje cada 30 minutos): los bloques
+# empiezan a las 0, 5 y 10 horas, así que el activo empezó hace 2 horas
+CHAIN_HOME="$TEST_HOME/chain-home"
+mkdir -p "$CHAIN_HOME/.claude-code"
+CHAIN_OUT=$(HOME="$CHAIN_HOME" python3 -c 'import json, os, time
+import usage_bar
+
+real_now = time.time()
+start = real_now - real_now % 3600 - 12 * 3600
+clock = [start]
+time.time = lambda: clock[0]
+
+directory = os.path.join(usage_bar.get_project_roots()[0], "-home-chain")
+os.makedirs(directory, exist_ok=True)
+path = os.path.join(directory, "chain-session.jsonl")
+
+# Un mensaje cada 30 minutos durante 12 horas, con un render después de cada uno
+for index in range(25):
+    clock[0] = start + index * 1800
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(clock[0]))
+    with open(path, "a") as f:
+        f.write(json.dumps({"type": "assistant", "timestamp": stamp, "requestId": f"req_{index}",
+                            "message": {"id": f"msg_{index}", "usage": {"input_tokens": 100, "output_tokens": 0}}}) + "\n")
+    os.utime(path, (clock[0], clock[0]))
+    if index == 12:
+        # A mitad de camino, un proceso nuevo: la cadena sale de block-cache.json
+        usage_bar._BLOCK_CACHE = None
+    block = usage_bar.get_active_block()
+
+print(round((clock[0] - block[0]) / 3600, 1), block[1])')
+echo "  horas desde el inicio del bloque, tokens: $CHAIN_OUT"
+check "El bloque activo empezó hace 2 horas y suma 5 mensajes" '[ "$CHAIN_OUT" = "2.0 500" ]'
+echo ""
+
+echo -e "${BLUE}Test 33: Burn rate, proyección y segmento Limit:${NC}"
+BURN_HOME="$TEST_HOME/burn-home"
+mkdir -p "$BURN_HOME/.claude-code"
+BURN_OUT=$(HOME="$BURN_HOME" python3 -c 'import time
+import usage_bar
+
+# get_burn_rate: solo la ventana reciente, al menos 30 s y consumo positivo
+now = 10000.0
+results = [
+    usage_bar.get_burn_rate([(now - 60, 1000), (now, 1600)], now),
+    usage_bar.get_burn_rate([(now - 3600, 0), (now - 60, 1000), (now, 1600)], now),
+    usage_bar.get_burn_rate([(now - 20, 1000), (now, 1600)], now),
+    usage_bar.get_burn_rate([(now - 60, 1000), (now, 1000)], now),
+    usage_bar.get_burn_rate([(now, 1000)], now),
+]
+
+# project_exhaustion: 1000 tokens en 60 s, faltan 8000 → 480 s más
+clock = [time.time()]
+time.time = lambda: clock[0]
+start = clock[0]
+first = usage_bar.project_exhaustion("unit", 1000, 10000)
+clock[0] += 60
+epoch, rate = usage_bar.project_exhaustion("unit", 2000, 10000)
+results += [first, round(epoch - start), round(rate * 60)]
+print(*results, sep="|")')
+echo "  $BURN_OUT"
+check "get_burn_rate: 10 tokens/s e ignora muestras fuera de la ventana" '[ "$(echo "$BURN_OUT" | cut -d"|" -f1-2)" = "10.0|10.0" ]'
+check "get_burn_rate: None con menos de 30 s, sin consumo o una sola muestra" '[ "$(echo "$BURN_OUT" | cut -d"|" -f3-5)" = "None|None|None" ]'
+check "project_exhaustion: sin ritmo no proyecta; con ritmo, límite a los 540 s" '[ "$(echo "$BURN_OUT" | cut -d"|" -f6-8)" = "(None, None)|540|1000" ]'
+# Renders con el porcentaje de claude.ai: dos sesiones con modelos de límite
+# distinto (200K y 1.7M) comparten la serie "_web" sin mezclar escalas, y un
+# aumento real del porcentaje proyecta el límite en rojo
+mkdir -p "$BURN_HOME/.claude/projects/-home-burn"
+echo "{\"type\":\"assistant\",\"timestamp\":\"$(date -u +%Y-%m-%dT%H:%M:%SZ)\",\"requestId\":\"req_burn\",\"message\":{\"id\":\"msg_burn\",\"usage\":{\"input_tokens\":100,\"output_tokens\":0}}}" \
+    > "$BURN_HOME/.claude/projects/-home-burn/burn-session.jsonl"
+WEB_BURN_OUT=$(HOME="$BURN_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 -c 'import json, os, time
+import usage_bar
+
+clock = [time.time()]
+time.time = lambda: clock[0]
+cache = usage_bar.get_state_path("usage-cache.json")
+
+def render(model, percentage, advance):
+    clock[0] += advance
+    with open(cache, "w") as f:
+        json.dump({"percentage": percentage}, f)
+    os.utime(cache, (clock[0], clock[0]))
+    data = {"session_id": "burn-session", "model": {"id": model}}
+    return usage_bar.render_status_bar(json.dumps(data), 120, "block")
+
+for line in (render("claude-opus-4", 40, 0), render("claude-sonnet-4-5", 40, 60), render("claude-opus-4", 50, 60)):
+    print(line.replace("\033", "ESC"))
+expected = time.strftime("%H:%M", time.localtime(clock[0] + 600))
+print("ESC[31m Limit: " + expected)')
+echo "$WEB_BURN_OUT" | sed 's/^/  /'
+WEB_BURN_EXPECTED=$(echo "$WEB_BURN_OUT" | sed -n 4p)
+check "Cambiar de modelo con el mismo porcentaje no proyecta un límite" '[[ "$(echo "$WEB_BURN_OUT" | sed -n 2p)" != *"Limit:"* ]]'
+check "Subir del 40% al 50% en 2 minutos proyecta el límite en rojo en 10 minutos" '[[ "$(echo "$WEB_BURN_OUT" | sed -n 3p)" == *"$WEB_BURN_EXPECTED"* ]]'
+echo ""
+
+echo -e "${BLUE}Test 34: Fuentes: fallback perezoso por prioridad${NC}"
+SOURCES_HOME="$TEST_HOME/sources-home"
+mkdir -p "$SOURCES_HOME/.claude-code"
+SOURCES_OUT=$(HOME="$SOURCES_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 -c 'import json
+import usage_bar
+
+calls = []
+def counted(name, source):
+    def run(data, mode):
+        calls.append(name)
+        return source(data, mode)
+    return name, run
+usage_bar.USAGE_SOURCES = tuple(counted(name, source) for name, source in usage_bar.USAGE_SOURCES)
+
+data = {"session_id": "none", "current_tokens": 50000, "model": {"id": "claude-opus-4"}}
+with open(usage_bar.get_state_path("usage-cache.json"), "w") as f:
+    json.dump({"percentage": 42}, f)
+web = usage_bar.resolve_usage(data, "cumulative")["percentage"]
+web_calls = ",".join(calls)
+del calls[:]
+usage_bar.os.unlink(usage_bar.get_state_path("usage-cache.json"))
+stdin = usage_bar.resolve_usage(data, "cumulative")["percentage"]
+print(web, web_calls, stdin, ",".join(calls))')
+echo "  $SOURCES_OUT"
+check "Con el cache web al día no se consultan las otras fuentes" '[ "$(echo $SOURCES_OUT | cut -d" " -f1-2)" = "42 web" ]'
+check "Sin datos web ni locales se cae en orden hasta stdin" '[ "$(echo $SOURCES_OUT | cut -d" " -f3-4)" = "25 web,local,stdin" ]'
+echo ""
+
+echo -e "${BLUE}Test 35: Índice de sesiones: sin recorrer el árbol para una sesión conocida${NC}"
+INDEX_HOME="$TEST_HOME/index-home"
+for project in 0 1 2 3 4 5 6 7; do
+    mkdir -p "$INDEX_HOME/.claude/projects/-home-p$project"
+    echo '{"type":"assistant","timestamp":"2025-01-01T10:00:00Z","message":{"usage":{"input_tokens":100,"output_tokens":10}}}' \
+        > "$INDEX_HOME/.claude/projects/-home-p$project/session-$project.jsonl"
+done
+mkdir -p "$INDEX_HOME/.claude-code"
+# Directorios asentados (mtime viejo): el índice los da por vistos
+touch -d '-1 hour' "$INDEX_HOME/.claude/projects" "$INDEX_HOME/.claude/projects"/*
+# Cada llamada es un render en un proceso nuevo; imprime los directorios
+# de proyectos que listó con os.scandir
+scandir_render() {
+    HOME="$INDEX_HOME" CLAUDE_STATUSBAR_USAGE_URL="http://127.0.0.1:9/" python3 -c 'import json, os, sys
+import usage_bar
+
+root = os.path.join(os.path.expanduser("~"), ".claude", "projects")
+listed = []
+real_scandir = os.scandir
+def counting_scandir(path="."):
+    if str(path).startswith(root):
+        listed.append(os.path.basename(path))
+    return real_scandir(path)
+usage_bar.os.scandir = counting_scandir
+
+line = usage_bar.render_status_bar(json.dumps({"session_id": sys.argv[1], "model": {"id": "claude-opus-4"}}), 80, "cumulative")
+print(len(listed), ",".join(sorted(listed)) or "-", "%" in line)' "$1"
+}
+INDEX_FIRST=$(scandir_render session-3)
+INDEX_KNOWN=$(scandir_render session-3)
+echo '{"type":"assistant","timestamp":"2025-01-01T11:00:00Z","message":{"usage":{"input_tokens":100,"output_tokens":10}}}' \
+    > "$INDEX_HOME/.claude/projects/-home-p5/session-new.jsonl"
+touch -d '-30 minutes' "$INDEX_HOME/.claude/projects/-home-p5"
+INDEX_NEW=$(scandir_render session-new)
+echo "  primer render: $INDEX_FIRST / sesión conocida: $INDEX_KNOWN / sesión nueva: $INDEX_NEW"
+check "El primer render recorre la raíz y los 8 proyectos" '[ "$(echo $INDEX_FIRST | cut -d" " -f1)" = "9" ]'
+check "Una sesión conocida no lista ningún directorio" '[ "$INDEX_KNOWN" = "0 - True" ]'
+check "Una sesión nueva solo relista el directorio cuyo mtime cambió" '[ "$INDEX_NEW" = "1 -home-p5 True" ]'
+echo ""
+
+echo -e "${BLUE}Test 36: fetch_usage_urllib corta la lectura apenas matchea${NC}"
+# Página de 32 MB con los dos patrones al principio: el servidor cuenta lo
+# que llegó a enviar antes de que el cliente cerrara la conexión
+EARLY_OUT=$(HOME="$TEST_HOME" python3 -c 'import http.server, threading
+import usage_bar
+
+CHUNK = b"<p>" + b"x" * (64 * 1024 - 7) + b"</p>"
+CHUNKS = 512
+sent = []
+done = threading.Event()
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        total = 0
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(CHUNK) * (CHUNKS + 1)))
+            self.end_headers()
+            for index in range(CHUNKS + 1):
+                data = b"<div>42% used</div><div>Resets in 2 hr 10 min</div>".ljust(len(CHUNK)) if index == 0 else CHUNK
+                self.wfile.write(data)
+                total += len(data)
+        except OSError:
+            pass
+        finally:
+            sent.append(total)
+            done.set()
+
+    def log_message(self, *args):
+        pass
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+result = usage_bar.fetch_usage_urllib("http://127.0.0.1:%d/" % server.server_address[1], "token", {})
+done.wait(10)
+server.shutdown()
+print(result["percentage"], result["reset_minutes"], sent[0] < len(CHUNK) * (CHUNKS + 1) // 4)')
+echo "  porcentaje, minutos al reset, cortó antes del 25% del cuerpo: $EARLY_OUT"
+check "Con los patrones al principio no se baja el resto de la página" '[ "$EARLY_OUT" = "42 130 True" ]'
+echo ""
+
+echo -e "${BLUE}Test 37: report: numpy (bincount) y Python dan lo mismo${NC}"
+NUMPY_OUT=$(HOME="$TEST_HOME" python3 -c 'import random, time
+from array import array
+import usage_bar
+
+try:
+    import numpy
+except ImportError:
+    print("sin-numpy")
+    raise SystemExit
+
+# 5000 mensajes en 10 días, 4 proyectos, 12 sesiones y 3 modelos (uno sin precio)
+random.seed(7)
+now = time.time()
+rows = 5000
+data = {
+    "timestamp": [now - random.uniform(0, 10 * 86400) for _ in range(rows)],
+    "project": [random.randrange(4) for _ in range(rows)],
+    "session": [random.randrange(12) for _ in range(rows)],
+    "model": [random.randrange(3) for _ in range(rows)],
+}
+for name, _ in usage_bar.WAREHOUSE_COLUMNS[4:]:
+    data[name] = [random.randrange(0, 50000) for _ in range(rows)]
+manifest = {"rows": rows, "dictionaries": {
+    "project": ["-home-p%d" % i for i in range(4)],
+    "session": ["session-%d" % i for i in range(12)],
+    "model": ["claude-sonnet-4-5", "claude-opus-4", "modelo-sin-precio"],
+}}
+python_columns = {name: array(typecode, data[name]) for name, typecode in usage_bar.WAREHOUSE_COLUMNS}
+numpy_columns = {name: numpy.array(data[name], dtype=numpy.dtype(typecode)) for name, typecode in usage_bar.WAREHOUSE_COLUMNS}
+
+def rounded(report):
+    return {group: (row["messages"], row["tokens"], None if row["cost"] is None else round(row["cost"], 6))
+            for group, row in report.items()}
+
+results = []
+for group_by in usage_bar.REPORT_GROUPS:
+    for since in (None, now - 3 * 86400):
+        expected = rounded(usage_bar.aggregate_usage(python_columns, manifest, group_by, since))
+        actual = rounded(usage_bar.aggregate_usage(numpy_columns, manifest, group_by, since, numpy))
+        results.append(expected == actual and len(expected) > 1)
+print(all(results), len(results))')
+if [ "$NUMPY_OUT" = "sin-numpy" ]; then
+    echo -e "  ${YELLOW}numpy no está instalado: se omite la comparación${NC}"
+else
+    echo "  iguales, combinaciones: $NUMPY_OUT"
+    check "Mismos mensajes, tokens y costo por grupo con y sin numpy" '[ "$NUMPY_OUT" = "True 8" ]'
+fi
+echo ""
+
 echo -e "${GREEN}=== Todas las pruebas completadas ===${NC}"
 echo ""
 echo -e "${YELLOW}Verifica que:${NC}"
@@ -63,3 +952,5 @@ echo "2. El porcentaje coincida con el uso esperado"
 echo "3. El tiempo de reset se muestre (Today HH:MM o Tmrw HH:MM)"
 echo "4. Todo esté en una sola línea"
 echo "5. Los errores se manejen correctamente"
+
+exit $((FAILURES > 0))
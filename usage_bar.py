@@ -3,45 +3,532 @@
 """
 Claude Code Status Bar - Muestra uso de contexto y tiempo de reset
 Formato: [████████░░] 75% Reset: Sat 00:00
+
+Este script se ejecuta cientos de veces por hora: el arranque del intérprete
+domina el costo. A nivel de módulo solo se importa lo que usa todo render;
+subprocess, re, datetime, etc. se importan dentro de las funciones que los
+necesitan (refresco web, daemon, primera lectura de una sesión)
 """
 import json
 import sys
-import shutil
 import os
-import re
-import subprocess
-from pathlib import Path
-from datetime import datetime, timedelta
+import time
+import _thread
 
 def get_terminal_width():
-    """Obtiene el ancho actual de la terminal"""
+    """Obtiene el ancho actual de la terminal (mismo criterio que shutil.get_terminal_size)"""
+    try:
+        columns = int(os.environ.get('COLUMNS', 0))
+    except ValueError:
+        columns = 0
+    if columns > 0:
+        return columns
+
     try:
-        return shutil.get_terminal_size().columns
+        return os.get_terminal_size(sys.__stdout__.fileno()).columns
     except:
         return 80
 
+# Raíces donde Claude guarda los transcripts de cada proyecto
+PROJECT_ROOTS = (
+    os.path.join("~", ".claude", "projects"),
+    os.path.join("~", ".config", "claude", "projects"),
+)
+
+# Totales mantenidos por el watcher de inotify (solo en el daemon):
+# session_id -> (ruta del transcript, totales)
+_LIVE_TOTALS = {}
+_WATCHER = None
+
+# Índice persistente: session_id -> ruta del JSONL y timestamp de inicio
+_SESSION_INDEX = None
+_SESSION_INDEX_DIRTY = False
+
+def get_state_path(*parts):
+    """Ruta dentro de ~/.claude-code donde el script guarda su estado"""
+    return os.path.join(os.path.expanduser("~"), ".claude-code", *parts)
+
+def get_project_roots():
+    """Directorios de proyectos de Claude (expandidos con el HOME actual)"""
+    return [os.path.expanduser(root) for root in PROJECT_ROOTS]
+
+def load_json_file(path, default=None):
+    """Lee un archivo JSON; retorna default si no existe o está corrupto"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def atomic_write_json(path, data):
+    """
+    Escribe JSON de forma atómica (archivo temporal + rename)
+    Un lector concurrente ve el archivo viejo o el nuevo, nunca uno a medias
+    (el temporal lleva pid e hilo: en el daemon las fuentes corren en paralelo)
+    """
+    from _thread import get_ident
+
+    tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+# --- Presupuesto de latencia: con CLAUDE_STATUSBAR_BUDGET_MS el render se
+# reparte en etapas con deadline; una etapa que se pasa corta su trabajo
+# (guardando el avance) y el valor se muestra marcado como viejo ---
+
+# Etapas en orden y peso relativo de cada una en el presupuesto
+BUDGET_STAGES = (("web", 1), ("session_lookup", 2), ("token_parse", 5), ("reset", 2))
+STALE_GLYPH = "≈"
+
+# Presupuesto y perfil del render en curso, por hilo (None = apagados): el
+# daemon atiende cada conexión en su propio hilo
+_RENDER = _thread._local()
+
+def current_budget():
+    """Presupuesto del render que corre en este hilo (o None)"""
+    return getattr(_RENDER, 'budget', None)
+
+def current_profile():
+    """Tiempos del render que corre en este hilo (o None)"""
+    return getattr(_RENDER, 'profile', None)
+
+def get_budget_seconds():
+    """Presupuesto total del render en segundos (None = sin límite)"""
+    try:
+        budget_ms = float(os.environ.get("CLAUDE_STATUSBAR_BUDGET_MS", ""))
+    except ValueError:
+        return None
+    return budget_ms / 1000 if budget_ms > 0 else None
+
+def begin_budget():
+    """Arranca el reloj del render (no hace nada sin presupuesto)"""
+    budget = get_budget_seconds()
+    if budget is None:
+        _RENDER.budget = None
+        return
+    _RENDER.budget = {'end': time.perf_counter() + budget, 'total': budget, 'stale': set(), 'threads': {}}
+
+def _thread_stage(state):
+    """Etapa en curso del hilo actual: las fuentes pueden correr en paralelo"""
+    from _thread import get_ident
+
+    return state['threads'].setdefault(get_ident(), {
+        'stage': None, 'started': 0, 'deadline': state.get('end', 0), 'overran': False,
+    })
+
+def begin_stage(name):
+    """
+    Fija el deadline de la etapa: el tiempo que queda se reparte entre las
+    etapas pendientes según su peso, así lo que sobra de una pasa a las demás
+    """
+    profile = current_profile()
+    if profile is not None:
+        _thread_stage(profile).update(stage=name, started=time.perf_counter())
+    budget = current_budget()
+    if budget is None or name not in dict(BUDGET_STAGES):
+        return
+    now = time.perf_counter()
+    names = [stage for stage, _ in BUDGET_STAGES]
+    remaining = BUDGET_STAGES[names.index(name):]
+    weight = dict(BUDGET_STAGES)[name]
+    total_weight = sum(w for _, w in remaining)
+    _thread_stage(budget).update(stage=name, started=now, overran=False,
+                                 deadline=now + max(budget['end'] - now, 0) * weight / total_weight)
+
+def deadline_passed():
+    """True si la etapa en curso ya agotó su tiempo (los lectores cortan acá)"""
+    budget = current_budget()
+    if budget is None:
+        return False
+    stage = _thread_stage(budget)
+    if time.perf_counter() > stage['deadline']:
+        stage['overran'] = True
+    return stage['overran']
+
+def end_stage():
+    """Cierra la etapa en curso; si se pasó del deadline lo registra y retorna True"""
+    profile = current_profile()
+    if profile is not None:
+        stage = _thread_stage(profile)
+        if stage['stage'] is not None:
+            times = profile['times']
+            times[stage['stage']] = times.get(stage['stage'], 0) + time.perf_counter() - stage['started']
+            stage['stage'] = None
+    budget = current_budget()
+    if budget is None:
+        return False
+    stage = _thread_stage(budget)
+    name = stage['stage']
+    if name is None or not deadline_passed():
+        stage['stage'] = None
+        return False
+    stage['stage'] = None
+    budget['stale'].add(name)
+    record_overrun(name, (time.perf_counter() - stage['started']) * 1000)
+    return True
+
+def end_budget():
+    """Termina el render: fuera de él no hay deadlines (p. ej. el watcher)"""
+    _RENDER.budget = None
+
+def is_stale(*stages):
+    """True si alguna de las etapas se pasó de su deadline en este render"""
+    budget = current_budget()
+    return budget is not None and bool(budget['stale'].intersection(stages))
+
+def record_overrun(stage, elapsed_ms):
+    """Cuenta la demora en budget-overruns.json ({etapa: {count, last, max_ms}})"""
+    path = get_state_path("budget-overruns.json")
+    counters = load_json_file(path, {})
+    if not isinstance(counters, dict):
+        counters = {}
+    entry = counters.setdefault(stage, {'count': 0, 'last': 0, 'max_ms': 0})
+    entry['count'] = entry.get('count', 0) + 1
+    entry['last'] = int(time.time())
+    entry['max_ms'] = max(entry.get('max_ms', 0), round(elapsed_ms, 1))
+    atomic_write_json(path, counters)
+
+# --- Instrumentación opcional (CLAUDE_STATUSBAR_PROFILE=1): tiempo de cada
+# etapa del render, un registro binario por render en ~/.claude-code/profile.bin ---
+
+PROFILE_STAGES = ("stdin", "web", "session_lookup", "token_parse", "reset", "render")
+# Registro: epoch y microsegundos de cada etapa (PROFILE_MISSING = no corrió)
+PROFILE_RECORD_FORMAT = "<d6I"
+PROFILE_MISSING = 0xFFFFFFFF
+# Al llegar a este tamaño el archivo pasa a profile.bin.1 (se conservan dos)
+PROFILE_MAX_BYTES = 1 << 20
+
+def begin_profile():
+    """Empieza a medir el render (una sola vez por render)"""
+    if current_profile() is None and os.environ.get("CLAUDE_STATUSBAR_PROFILE") == "1":
+        _RENDER.profile = {'times': {}, 'threads': {}}
+
+def end_profile():
+    """Agrega el registro del render al final de profile.bin (O_APPEND)"""
+    profile = current_profile()
+    if profile is None:
+        return
+    import struct
+
+    times, _RENDER.profile = profile['times'], None
+    record = struct.pack(PROFILE_RECORD_FORMAT, time.time(), *[
+        min(int(times[stage] * 1_000_000), PROFILE_MISSING - 1) if stage in times else PROFILE_MISSING
+        for stage in PROFILE_STAGES
+    ])
+    path = get_state_path("profile.bin")
+    try:
+        try:
+            if os.stat(path).st_size >= PROFILE_MAX_BYTES:
+                os.replace(path, f"{path}.1")
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def print_stats():
+    """`usage_bar.py --stats`: p50/p95/max por etapa según profile.bin"""
+    import struct
+
+    record = struct.Struct(PROFILE_RECORD_FORMAT)
+    samples = {stage: [] for stage in PROFILE_STAGES + ("total",)}
+    path = get_state_path("profile.bin")
+    for part in (f"{path}.1", path):
+        try:
+            with open(part, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        usable = len(data) - len(data) % record.size
+        for values in record.iter_unpack(data[:usable]):
+            present = [value for value in values[1:] if value != PROFILE_MISSING]
+            for stage, value in zip(PROFILE_STAGES, values[1:]):
+                if value != PROFILE_MISSING:
+                    samples[stage].append(value / 1000)
+            if present:
+                samples["total"].append(sum(present) / 1000)
+
+    if not samples["total"]:
+        print("Sin datos: activar con CLAUDE_STATUSBAR_PROFILE=1 y renderizar algunas veces")
+        return 1
+
+    def percentile(values, pct):
+        return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+    print(f"{'etapa':<16}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        print(f"{stage:<16}{len(values):>8}{percentile(values, 50):>10.2f}"
+              f"{percentile(values, 95):>10.2f}{values[-1]:>10.2f}")
+    return 0
+
+# Cache de uso web: fresco durante WEB_CACHE_DURATION; pasado ese tiempo se
+# sigue sirviendo mientras se refresca en segundo plano, hasta un máximo de
+# WEB_CACHE_MAX_STALENESS segundos (después se usa el cálculo local)
+WEB_CACHE_DURATION = 60
+WEB_CACHE_MAX_STALENESS = int(os.environ.get("CLAUDE_STATUSBAR_MAX_STALENESS", "900"))
+USAGE_URL = os.environ.get("CLAUDE_STATUSBAR_USAGE_URL", "https://claude.ai/settings/usage")
+
 def get_web_usage_data():
     """
-    Obtiene datos de uso directamente desde claude.ai/settings/usage
+    Obtiene datos de uso de claude.ai/settings/usage desde el cache local
+    Nunca bloquea: si el cache está vencido lanza un refresco en segundo plano
+    y retorna el valor cacheado mientras no supere WEB_CACHE_MAX_STALENESS
+    Retorna: (percentage, reset_time_str) o (None, None) si no hay datos
+    """
+    cache_file = get_state_path("usage-cache.json")
+
+    try:
+        cache_age = time.time() - os.stat(cache_file).st_mtime
+    except OSError:
+        cache_age = None
+
+    if cache_age is None or cache_age >= WEB_CACHE_DURATION:
+        spawn_web_usage_refresh()
+
+    if cache_age is not None and cache_age < WEB_CACHE_MAX_STALENESS:
+        cache_data = _load_web_cache(cache_file)
+        if isinstance(cache_data, dict):
+            return cache_data.get('percentage'), cache_data.get('reset_time')
+
+    return None, None
+
+# Último usage-cache.json leído, junto con su mtime (evita releerlo en el daemon)
+_WEB_CACHE = (None, None)
+
+def _load_web_cache(cache_file):
+    """Lee usage-cache.json solo si cambió desde la última lectura"""
+    global _WEB_CACHE
+    try:
+        mtime_ns = os.stat(cache_file).st_mtime_ns
+    except OSError:
+        return None
+    if _WEB_CACHE[0] != mtime_ns:
+        _WEB_CACHE = (mtime_ns, load_json_file(cache_file))
+    return _WEB_CACHE[1]
+
+def get_credentials_path():
+    """Archivo de credenciales OAuth de Claude"""
+    return os.path.join(os.path.expanduser("~"), ".claude", ".credentials.json")
+
+def _claim_refresh_marker(marker):
+    """
+    Crea el marcador de refresco en curso de forma atómica (O_EXCL)
+    Retorna False si otro proceso ya lanzó un refresco hace menos de 10s
+    """
+    for _ in range(2):
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(marker).st_mtime < 10:
+                    return False
+                # Marcador abandonado (refresco que murió): se reemplaza
+                os.unlink(marker)
+            except OSError:
+                pass
+        except OSError:
+            return False
+    return False
+
+def spawn_web_usage_refresh():
+    """
+    Lanza `usage_bar.py --refresh-web-cache` como proceso desacoplado
+    Un archivo marcador evita lanzar un refresco por render mientras otro
+    todavía está en curso; el lock de refresh_web_usage_cache() garantiza
+    que, aun así, solo uno descargue la página
+    """
+    if not os.path.exists(get_credentials_path()):
+        return
+
+    marker = get_state_path("usage-cache.refreshing")
+    try:
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+    except OSError:
+        return
+    if not _claim_refresh_marker(marker):
+        return
+
+    import subprocess
+
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--refresh-web-cache"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
+
+def refresh_web_usage_cache():
+    """
+    Refresca el cache web con una sola descarga aunque haya muchas sesiones
+    en paralelo: un lock fcntl exclusivo (no bloqueante) elige un único
+    proceso; el resto retorna enseguida y sigue sirviendo el valor anterior
     Retorna: (percentage, reset_time_str) o (None, None) si falla
     """
-    cache_file = Path.home() / ".claude-code" / "usage-cache.json"
-    cache_duration = 60  # segundos
+    cache_file = get_state_path("usage-cache.json")
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
 
-    # Verificar cache
-    if cache_file.exists():
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        lock_file = open(get_state_path("usage-cache.lock"), 'a')
+    except OSError:
+        return None, None
+
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Otro proceso está descargando
+            lock_file.close()
+            return None, None
+
+    try:
+        # Double-check: quizás otro proceso refrescó mientras esperábamos
         try:
-            cache_age = datetime.now().timestamp() - cache_file.stat().st_mtime
-            if cache_age < cache_duration:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                    return cache_data.get('percentage'), cache_data.get('reset_time')
-        except:
+            if time.time() - os.stat(cache_file).st_mtime < WEB_CACHE_DURATION:
+                cache_data = load_json_file(cache_file, {})
+                return cache_data.get('percentage'), cache_data.get('reset_time')
+        except (OSError, AttributeError):
             pass
 
+        return _fetch_web_usage(cache_file)
+    finally:
+        # Con el lock tomado: el refresco en curso terminó
+        try:
+            os.unlink(get_state_path("usage-cache.refreshing"))
+        except OSError:
+            pass
+        lock_file.close()
+
+# Patrones de la página de uso: "69% used" y "Resets in 3 hr 27 min"
+USAGE_PERCENT_PATTERN = r'(\d+)%\s*used'
+USAGE_RESET_PATTERN = r'Resets in (\d+)\s*hr\s*(\d+)\s*min'
+# Solapamiento entre bloques al buscar en streaming (un match puede quedar cortado)
+USAGE_MATCH_OVERLAP = 256
+
+def _match_usage_html(html):
+    """Busca los dos patrones en el HTML; retorna (percentage_match, reset_match)"""
+    import re
+
+    return (re.search(USAGE_PERCENT_PATTERN, html, re.IGNORECASE),
+            re.search(USAGE_RESET_PATTERN, html, re.IGNORECASE))
+
+def _usage_result(percentage_match, reset_match):
+    """Resultado común de los proveedores a partir de los matches"""
+    if not percentage_match:
+        return None
+    reset_minutes = None
+    if reset_match:
+        reset_minutes = int(reset_match.group(1)) * 60 + int(reset_match.group(2))
+    return {'percentage': int(percentage_match.group(1)), 'reset_minutes': reset_minutes}
+
+def fetch_usage_curl(url, token, cached):
+    """
+    Proveedor original: descarga la página completa con curl y aplica las regex
+    No hace requests condicionales (cached se ignora)
+    """
+    import subprocess
+
+    result = subprocess.run([
+        'curl', '-s', '-L',
+        url,
+        '-H', f'Cookie: sessionKey={token}',
+        '-H', 'User-Agent: Mozilla/5.0'
+    ], capture_output=True, text=True, timeout=5)
+
+    return _usage_result(*_match_usage_html(result.stdout))
+
+def fetch_usage_urllib(url, token, cached):
+    """
+    Proveedor en proceso (urllib, sin fork de curl)
+    Envía If-None-Match / If-Modified-Since con los validadores de la
+    respuesta anterior: un 304 retorna {'not_modified': True}
+    El cuerpo se lee por bloques y la lectura se corta apenas matchean
+    los dos patrones, sin bajar el resto de la página
+    """
+    import codecs
+    import urllib.error
+    import urllib.request
+
+    headers = {'Cookie': f'sessionKey={token}', 'User-Agent': 'Mozilla/5.0'}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=5)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return {'not_modified': True}
+        raise
+
+    with response:
+        charset = response.headers.get_content_charset() or 'utf-8'
+        decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+        percentage_match = reset_match = None
+        window = ""
+        while not (percentage_match and reset_match):
+            chunk = response.read(16 * 1024)
+            if not chunk:
+                break
+            window = window[-USAGE_MATCH_OVERLAP:] + decoder.decode(chunk)
+            found_percentage, found_reset = _match_usage_html(window)
+            percentage_match = percentage_match or found_percentage
+            reset_match = reset_match or found_reset
+
+        result = _usage_result(percentage_match, reset_match)
+        if result is not None:
+            result['etag'] = response.headers.get('ETag')
+            result['last_modified'] = response.headers.get('Last-Modified')
+        return result
+
+# Proveedores de datos de uso web (CLAUDE_STATUSBAR_PROVIDER elige uno)
+# Cada uno recibe (url, token, cache_anterior) y retorna None si no hay
+# datos, {'not_modified': True} o {'percentage', 'reset_minutes', ...}
+USAGE_PROVIDERS = {
+    "urllib": fetch_usage_urllib,
+    "curl": fetch_usage_curl,
+}
+
+def get_usage_provider():
+    """Proveedor configurado (por defecto urllib)"""
+    name = os.environ.get("CLAUDE_STATUSBAR_PROVIDER", "urllib").lower()
+    return USAGE_PROVIDERS.get(name, fetch_usage_urllib)
+
+def _fetch_web_usage(cache_file):
+    """
+    Descarga los datos de uso con el proveedor configurado (bloqueante) y
+    actualiza el cache. Se ejecuta en el proceso de refresco, fuera del render
+    Retorna: (percentage, reset_time_str) o (None, None) si falla
+    """
+    from datetime import datetime, timedelta
+
     # Leer credenciales
-    creds_file = Path.home() / ".claude" / ".credentials.json"
-    if not creds_file.exists():
+    creds_file = get_credentials_path()
+    if not os.path.exists(creds_file):
         return None, None
 
     try:
@@ -52,52 +539,48 @@ def get_web_usage_data():
         if not token:
             return None, None
 
-        # Intentar obtener datos con curl
-        result = subprocess.run([
-            'curl', '-s', '-L',
-            'https://claude.ai/settings/usage',
-            '-H', f'Cookie: sessionKey={token}',
-            '-H', 'User-Agent: Mozilla/5.0'
-        ], capture_output=True, text=True, timeout=5)
-
-        html = result.stdout
-
-        # Parsear HTML para extraer porcentaje y reset time
-        # Buscar patrones como "69% used" y "Resets in 3 hr 27 min"
-        percentage_match = re.search(r'(\d+)%\s*used', html, re.IGNORECASE)
-        reset_match = re.search(r'Resets in (\d+)\s*hr\s*(\d+)\s*min', html, re.IGNORECASE)
-
-        if percentage_match:
-            percentage = int(percentage_match.group(1))
-
-            # Calcular reset time
-            reset_str = None
-            if reset_match:
-                hours = int(reset_match.group(1))
-                minutes = int(reset_match.group(2))
-                reset_time = datetime.now() + timedelta(hours=hours, minutes=minutes)
-
-                # Formato: "Today 17:00" o "Tmrw 02:00"
-                if reset_time.date() == datetime.now().date():
-                    reset_str = f"Today {reset_time.strftime('%H:%M')}"
-                elif reset_time.date() == (datetime.now() + timedelta(days=1)).date():
-                    reset_str = f"Tmrw {reset_time.strftime('%H:%M')}"
-                else:
-                    reset_str = reset_time.strftime("%a %H:%M")
-
-            # Guardar en cache
-            try:
-                cache_file.parent.mkdir(parents=True, exist_ok=True)
-                with open(cache_file, 'w') as f:
-                    json.dump({
-                        'percentage': percentage,
-                        'reset_time': reset_str,
-                        'timestamp': datetime.now().isoformat()
-                    }, f)
-            except:
-                pass
+        cached = load_json_file(cache_file, {})
+        if not isinstance(cached, dict):
+            cached = {}
 
-            return percentage, reset_str
+        result = get_usage_provider()(USAGE_URL, token, cached)
+        if result is None:
+            return None, None
+
+        if result.get('not_modified'):
+            # La página no cambió: se renueva el cache con los mismos valores
+            if cached.get('percentage') is None:
+                return None, None
+            cached['timestamp'] = datetime.now().isoformat()
+            atomic_write_json(cache_file, cached)
+            return cached['percentage'], cached.get('reset_time')
+
+        percentage = result['percentage']
+
+        # Calcular reset time
+        reset_str = None
+        if result.get('reset_minutes') is not None:
+            reset_time = datetime.now() + timedelta(minutes=result['reset_minutes'])
+
+            # Formato: "Today 17:00" o "Tmrw 02:00"
+            if reset_time.date() == datetime.now().date():
+                reset_str = f"Today {reset_time.strftime('%H:%M')}"
+            elif reset_time.date() == (datetime.now() + timedelta(days=1)).date():
+                reset_str = f"Tmrw {reset_time.strftime('%H:%M')}"
+            else:
+                reset_str = reset_time.strftime("%a %H:%M")
+
+        # Guardar en cache (atómico: los renders concurrentes nunca
+        # leen un archivo a medio escribir)
+        atomic_write_json(cache_file, {
+            'percentage': percentage,
+            'reset_time': reset_str,
+            'timestamp': datetime.now().isoformat(),
+            'etag': result.get('etag'),
+            'last_modified': result.get('last_modified'),
+        })
+
+        return percentage, reset_str
 
     except Exception as e:
         pass
@@ -124,6 +607,34 @@ def get_context_limit(model_info):
     # Por defecto 200K para otros modelos
     return 200_000
 
+def get_context_window(model_info):
+    """
+    Tamaño de la ventana de contexto del modelo (modo "context")
+    - Sonnet 4.5: 1M tokens
+    - Otros modelos: 200K tokens
+    """
+    if not model_info:
+        return 200_000
+
+    model_id = model_info.get('id', '').lower()
+    model_name = model_info.get('display_name', '').lower()
+
+    if 'sonnet-4-5' in model_id or 'sonnet 4.5' in model_name:
+        return 1_000_000
+
+    return 200_000
+
+# Modos de cálculo local:
+# - cumulative: suma de tokens de toda la sesión contra el límite de sesión
+# - context: ocupación actual de la ventana de contexto (último mensaje)
+# - block: bloque de 5 horas activo, sumando todas las sesiones y proyectos
+USAGE_MODES = ("cumulative", "context", "block")
+
+def get_usage_mode():
+    """Modo configurado con CLAUDE_STATUSBAR_MODE (por defecto cumulative)"""
+    mode = os.environ.get("CLAUDE_STATUSBAR_MODE", "cumulative").lower()
+    return mode if mode in USAGE_MODES else "cumulative"
+
 def get_plan_name(model_info):
     """
     Determina el nombre del plan según el modelo
@@ -143,114 +654,1210 @@ def get_plan_name(model_info):
 
     return "Free"
 
-def calculate_session_reset(session_id):
+def load_session_index():
     """
-    Calcula el reset de la sesión basado en el primer mensaje + 5 horas
-    La sesión dura 5 horas desde el primer mensaje o hasta que se alcance el límite
+    Carga el índice de sesiones desde disco (una vez por proceso)
+    Formato: {"dirs": {ruta: {"mtime": ns, "subdirs": [...]}},
+              "sessions": {session_id: {"path": ruta, "start": epoch,
+                                        "no_start": [inodo, tamaño]}}}
     """
-    # Buscar el archivo JSONL de la sesión
-    possible_paths = [
-        Path.home() / ".claude" / "projects",
-        Path.home() / ".config" / "claude" / "projects"
-    ]
+    global _SESSION_INDEX
+    if _SESSION_INDEX is None:
+        data = load_json_file(get_state_path("session-index.json"), {})
+        if not isinstance(data, dict):
+            data = {}
+        _SESSION_INDEX = {
+            'dirs': data.get('dirs', {}),
+            'sessions': data.get('sessions', {}),
+        }
+    return _SESSION_INDEX
+
+def save_session_index():
+    """Persiste el índice solo si cambió desde la última escritura"""
+    global _SESSION_INDEX_DIRTY
+    if _SESSION_INDEX is not None and _SESSION_INDEX_DIRTY:
+        atomic_write_json(get_state_path("session-index.json"), _SESSION_INDEX)
+        _SESSION_INDEX_DIRTY = False
+
+# Transcripts archivados (comprimidos en el lugar): nunca cambian
+TRANSCRIPT_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+ARCHIVE_SUFFIXES = (".jsonl.gz", ".jsonl.zst")
+
+def _session_id_from_filename(name):
+    """Retorna el session_id de un transcript, o None si no es un JSONL"""
+    for suffix in TRANSCRIPT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+def is_archived_transcript(path):
+    """True si el transcript está comprimido (.jsonl.gz o .jsonl.zst)"""
+    return path.endswith(ARCHIVE_SUFFIXES)
+
+def open_transcript(path):
+    """
+    Abre un transcript en binario, descomprimiendo en streaming si hace falta
+    .jsonl.gz usa gzip (stdlib); .jsonl.zst, el módulo zstd de la stdlib
+    (Python 3.14+) o el paquete zstandard, si alguno está disponible
+    """
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, 'rb')
+
+    if path.endswith(".zst"):
+        try:
+            from compression import zstd
+            return zstd.open(path, 'rb')
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise OSError(f"sin soporte zstd para {path}")
+        import io
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
 
-    for base_path in possible_paths:
-        if not base_path.exists():
+    return open(path, 'rb')
+
+def transcript_resume_offset(state, path, st):
+    """
+    Desde dónde seguir leyendo un transcript con estado guardado ({"inode",
+    "size", "mtime_ns", "offset"}): None si no cambió, 0 si hay que releerlo
+    El offset de un archivo comprimido es del contenido descomprimido y no se
+    compara con su tamaño: un archivo así no crece, se relee solo si cambió
+    """
+    if not state or state.get('inode') != st.st_ino:
+        return 0
+    if is_archived_transcript(path):
+        if state.get('size') == st.st_size and state.get('mtime_ns') == st.st_mtime_ns:
+            return None
+        return 0
+    if state.get('offset', 0) > st.st_size:
+        return 0
+    if state.get('size') == st.st_size:
+        return None
+    return state['offset']
+
+def _pread_fd(f):
+    """fd para releer líneas gigantes con pread (solo en archivos sin comprimir)"""
+    import io
+
+    if isinstance(f, io.BufferedReader) and isinstance(f.raw, io.FileIO):
+        return f.fileno()
+    return None
+
+def refresh_session_index():
+    """
+    Actualiza el índice comparando el mtime de cada directorio de proyectos
+    Solo se listan (os.scandir) los directorios cuyo mtime cambió; para el
+    resto basta un stat y se reutiliza la lista de subdirectorios guardada
+    """
+    global _SESSION_INDEX_DIRTY
+    index = load_session_index()
+    dirs = index['dirs']
+    sessions = index['sessions']
+    now_ns = time.time_ns()
+    seen = set()
+    pending = get_project_roots()
+
+    complete = True
+
+    while pending:
+        if deadline_passed():
+            # Sin tiempo: lo pendiente se recorre en el próximo render
+            complete = False
+            break
+        dir_path = pending.pop()
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
             continue
+        seen.add(dir_path)
 
-        for jsonl_file in base_path.rglob("*.jsonl"):
-            if session_id in jsonl_file.name:
-                try:
-                    # Leer líneas hasta encontrar el primer timestamp (inicio de sesión)
-                    with open(jsonl_file, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            if not line.strip():
-                                continue
-
-                            data = json.loads(line)
-
-                            # Buscar timestamp en diferentes ubicaciones
-                            timestamp = None
-                            if 'timestamp' in data:
-                                timestamp = data['timestamp']
-                            elif 'created_at' in data:
-                                timestamp = data['created_at']
-                            elif 'message' in data and 'timestamp' in data['message']:
-                                timestamp = data['message']['timestamp']
-
-                            if timestamp:
-                                # Parsear timestamp y calcular reset (inicio + 5 horas)
-                                try:
-                                    start_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                                    # Convertir a hora local si es necesario
-                                    if start_time.tzinfo:
-                                        start_time = start_time.astimezone()
-                                    reset_time = start_time + timedelta(hours=5)
-                                    return reset_time.strftime('%H:%M')
-                                except:
-                                    pass
-                                # Salir después de encontrar el primer timestamp válido
-                                break
-                except:
-                    pass
+        entry = dirs.get(dir_path)
+        if entry and entry.get('mtime') == mtime_ns:
+            pending.extend(entry.get('subdirs', []))
+            continue
+
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        subdirs.append(dir_entry.path)
+                        continue
+                    session_id = _session_id_from_filename(dir_entry.name)
+                    if session_id:
+                        session = sessions.setdefault(session_id, {})
+                        current = session.get('path')
+                        # Si conviven el JSONL y su archivo comprimido, manda el JSONL
+                        if (current != dir_entry.path
+                                and not (current and not is_archived_transcript(current)
+                                         and is_archived_transcript(dir_entry.path)
+                                         and os.path.exists(current))):
+                            session['path'] = dir_entry.path
+        except OSError:
+            continue
+
+        # Un directorio modificado hace menos de 2s puede volver a cambiar
+        # sin que su mtime avance; no lo damos por visto hasta que se asiente
+        if now_ns - mtime_ns < 2_000_000_000:
+            mtime_ns = None
+        dirs[dir_path] = {'mtime': mtime_ns, 'subdirs': subdirs}
+        pending.extend(subdirs)
+        _SESSION_INDEX_DIRTY = True
+
+    if not complete:
+        return
+
+    for dir_path in list(dirs):
+        if dir_path not in seen:
+            del dirs[dir_path]
+            _SESSION_INDEX_DIRTY = True
+
+def _lookup_session(session_id):
+    """Busca la sesión en el índice sin tocar el árbol de directorios"""
+    global _SESSION_INDEX_DIRTY
+    sessions = load_session_index()['sessions']
+
+    candidates = [session_id] if session_id in sessions else [
+        key for key in sessions if session_id in key
+    ]
+    for key in candidates:
+        session = sessions[key]
+        path = session.get('path')
+        if path and os.path.exists(path):
+            return session
+        # El archivo ya no existe: se descarta la entrada
+        del sessions[key]
+        _SESSION_INDEX_DIRTY = True
+    return None
+
+def find_session(session_id):
+    """
+    Retorna la entrada del índice para session_id ({"path", "start"}) o None
+    Para una sesión conocida no se recorre el árbol de proyectos
+    """
+    if not session_id:
+        return None
+
+    session = _lookup_session(session_id)
+    if session is None:
+        refresh_session_index()
+        session = _lookup_session(session_id)
+
+    save_session_index()
+    return session
+
+def _read_first_timestamp(jsonl_path):
+    """Lee líneas hasta encontrar el primer timestamp y lo retorna como epoch"""
+    from datetime import datetime
+
+    if is_archived_transcript(jsonl_path):
+        return get_archive_summary(jsonl_path)['start']
+
+    try:
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if deadline_passed():
+                    break
+                if not line.strip():
+                    continue
+
+                data = json.loads(line)
+
+                # Buscar timestamp en diferentes ubicaciones
+                timestamp = None
+                if 'timestamp' in data:
+                    timestamp = data['timestamp']
+                elif 'created_at' in data:
+                    timestamp = data['created_at']
+                elif 'message' in data and 'timestamp' in data['message']:
+                    timestamp = data['message']['timestamp']
+
+                if timestamp:
+                    try:
+                        return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+                    except:
+                        pass
+                    # Salir después de encontrar el primer timestamp
+                    break
+    except:
+        pass
+
+    return None
+
+def get_session_start(session_id):
+    """
+    Retorna el epoch del primer mensaje de la sesión (o None)
+    El inicio de una sesión nunca cambia, así que se guarda en el índice.
+    Un transcript sin timestamps también: se recuerda por (inodo, tamaño)
+    y no se vuelve a leer hasta que cambie
+    """
+    global _SESSION_INDEX_DIRTY
+    session = find_session(session_id)
+    if session is None:
+        return None
+
+    if session.get('start') is None:
+        try:
+            st = os.stat(session['path'])
+            key = [st.st_ino, st.st_size]
+        except OSError:
+            key = None
+        if key is not None and session.get('no_start') == key:
+            return None
+
+        start = _read_first_timestamp(session['path'])
+        if start is None:
+            # Si se cortó por el deadline no se leyó todo: no hay resultado
+            if key is not None and not deadline_passed():
+                session['no_start'] = key
+                _SESSION_INDEX_DIRTY = True
+                save_session_index()
+            return None
+        session['start'] = start
+        session.pop('no_start', None)
+        _SESSION_INDEX_DIRTY = True
+        save_session_index()
+
+    return session['start']
 
-    # Fallback: si no se encuentra, retornar hora desconocida
-    return "--:--"
+def calculate_session_reset(session_id):
+    """
+    Calcula el reset de la sesión basado en el primer mensaje + 5 horas
+    La sesión dura 5 horas desde el primer mensaje o hasta que se alcance el límite
+    """
+    start = get_session_start(session_id)
+    if start is None:
+        # Fallback: si no se encuentra, retornar hora desconocida
+        return "--:--"
+
+    # Hora local de inicio + 5 horas
+    return time.strftime('%H:%M', time.localtime(start + 5 * 3600))
 
 def get_session_tokens(session_id):
     """
     Lee el archivo JSONL de la sesión y calcula los tokens totales
     Retorna: (input_tokens, output_tokens, cache_creation, cache_read)
     """
-    # Buscar en las posibles ubicaciones de Claude
-    possible_paths = [
-        Path.home() / ".claude" / "projects",
-        Path.home() / ".config" / "claude" / "projects"
-    ]
+    # Con el watcher de inotify activo (daemon), los totales ya están al día
+    live = get_live_totals(session_id)
+    if live is not None:
+        return live
+
+    session = find_session(session_id)
+    if session is None:
+        # Sin tiempo para encontrar el transcript: último total conocido
+        checkpoint = load_checkpoint(session_id) if session_id and deadline_passed() else None
+        if checkpoint and isinstance(checkpoint.get('totals'), list):
+            return tuple(checkpoint['totals'])
+        return 0, 0, 0, 0
+
+    totals = parse_jsonl_tokens_incremental(session['path'], session_id)
+    # Solo si el watcher vigila el directorio: si no, nadie los actualizaría
+    if is_watched(session['path']) and not deadline_passed():
+        _LIVE_TOTALS[session_id] = (session['path'], totals)
+    return totals
+
+def is_watched(path):
+    """True si el watcher de inotify recibe los cambios del transcript en path"""
+    return _WATCHER is not None and _WATCHER.watches_dir(os.path.dirname(path))
+
+def get_live_totals(session_id):
+    """Totales del watcher para la sesión, o None si su transcript no está vigilado"""
+    live = _LIVE_TOTALS.get(session_id)
+    if live is None or not is_watched(live[0]):
+        return None
+    return live[1]
+
+def _usage_from_entry(data):
+    """Retorna el bloque usage de una entrada del JSONL (o {} si no tiene)"""
+    if not isinstance(data, dict):
+        return {}
+
+    # Extraer usage de diferentes ubicaciones posibles
+    usage = data.get('usage', {})
+    if not usage and isinstance(data.get('message'), dict):
+        usage = data['message'].get('usage', {})
+    return usage if isinstance(usage, dict) else {}
+
+def _add_line_usage(line, totals):
+    """
+    Suma el usage de una línea JSONL (bytes) a totals
+    Retorna False si la línea no es JSON válido
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return False
+
+    usage = _usage_from_entry(data)
+
+    totals[0] += usage.get('input_tokens', 0)
+    totals[1] += usage.get('output_tokens', 0)
+    totals[2] += usage.get('cache_creation_input_tokens', 0)
+    totals[3] += usage.get('cache_read_input_tokens', 0)
+    return True
+
+# Lectura binaria por bloques del JSONL
+READ_CHUNK_BYTES = 1 << 20
+# Líneas más largas que esto (tool results, imágenes en base64) no se
+# materializan: solo se conservan sus primeros y últimos bytes
+MAX_LINE_BYTES = 256 * 1024
+LINE_HEAD_BYTES = 4 * 1024
+LINE_TAIL_BYTES = 64 * 1024
+
+# Regex de bytes para extraer usage sin json.loads (compiladas al primer uso)
+_USAGE_FIELDS_RE = None
+_ASSISTANT_RE = None
+_USAGE_FIELD_INDEX = {
+    b'input_tokens': 0,
+    b'output_tokens': 1,
+    b'cache_creation_input_tokens': 2,
+    b'cache_read_input_tokens': 3,
+}
+
+def _extract_usage_fields(tail, head=b""):
+    """
+    Extrae los cuatro contadores de usage de una línea (bytes) con regex
+    Retorna la lista de valores o None si la extracción es ambigua (más de
+    un bloque usage, campos repetidos, o una línea que no es del assistant,
+    donde el usage podría pertenecer a otro objeto, p. ej. toolUseResult)
+    """
+    global _USAGE_FIELDS_RE, _ASSISTANT_RE
+    if _USAGE_FIELDS_RE is None:
+        import re
+        _USAGE_FIELDS_RE = re.compile(
+            rb'"(input_tokens|output_tokens|cache_creation_input_tokens|cache_read_input_tokens)"\s*:\s*(\d+)'
+        )
+        _ASSISTANT_RE = re.compile(rb'"(?:type|role)"\s*:\s*"assistant"')
+
+    if tail.count(b'"usage"') != 1:
+        return None
+    if not (_ASSISTANT_RE.search(tail) or _ASSISTANT_RE.search(head)):
+        return None
+
+    values = [None, None, None, None]
+    for name, number in _USAGE_FIELDS_RE.findall(tail):
+        index = _USAGE_FIELD_INDEX[name]
+        if values[index] is not None:
+            return None
+        values[index] = int(number)
+    return [value or 0 for value in values]
+
+def _line_usage_values(line, head=b"", fd=None, line_start=0, line_length=0):
+    """
+    Contadores de usage de una línea completa, o None si no tiene usage
+    Las líneas sin '"usage"' se descartan a nivel de bytes. Solo si la
+    extracción con regex es ambigua se recurre a json.loads (para líneas
+    gigantes, de las que solo se tiene la cola, se relee la línea entera)
+    En una línea gigante head y la cola no se solapan: un usage en head
+    no está en la cola, así que también se relee la línea entera
+    """
+    in_head = b'"usage"' in head
+    if not in_head and b'"usage"' not in line:
+        return None
+
+    values = None if in_head else _extract_usage_fields(line, head)
+    if values is None:
+        if fd is not None:
+            line = os.pread(fd, line_length, line_start)
+        values = [0, 0, 0, 0]
+        _add_line_usage(line, values)
+    return values
+
+# --- Deduplicación: un mensaje del assistant puede aparecer en varias líneas
+# (chunks del streaming, reintentos) con el mismo message.id y el mismo usage ---
+
+_MESSAGE_ID_RE = None
+_REQUEST_ID_RE = None
+
+def _find_json_string(data, prefix, pattern):
+    """Valor del string que sigue a prefix (JSON compacto) o, si no, de pattern"""
+    pos = data.find(prefix)
+    if pos >= 0:
+        start = pos + len(prefix)
+        end = data.find(b'"', start)
+        if end >= 0:
+            return data[start:end]
+    match = pattern.search(data)
+    return match.group(1) if match else None
+
+def _line_message_key(line, head=b""):
+    """
+    Clave "message.id:requestId" (bytes) de una línea con usage, o None
+    El id del mensaje está al principio de la línea (en head si es gigante)
+    y requestId después del contenido, en la cola
+    """
+    global _MESSAGE_ID_RE, _REQUEST_ID_RE
+    if _MESSAGE_ID_RE is None:
+        import re
+        _MESSAGE_ID_RE = re.compile(rb'"id"\s*:\s*"(msg_[^"]+)"')
+        _REQUEST_ID_RE = re.compile(rb'"requestId"\s*:\s*"([^"]+)"')
+
+    message_id = _find_json_string(head or line, b'"id":"', _MESSAGE_ID_RE)
+    if message_id is not None and not message_id.startswith(b"msg_"):
+        match = _MESSAGE_ID_RE.search(head or line)
+        message_id = match.group(1) if match else None
+    request_id = _find_json_string(line, b'"requestId":"', _REQUEST_ID_RE)
+    if message_id is None and request_id is None:
+        return None
+    return (message_id or b"") + b":" + (request_id or b"")
+
+class SeenMessages:
+    """
+    Mensajes ya sumados, como hashes de 64 bits de su clave
+    Los ya persistidos se guardan ordenados en un array('Q') (8 bytes por
+    mensaje, búsqueda binaria); los de esta pasada, en un set chico hasta
+    que se persisten con save_seen_messages(). Con presorted, stored ya es
+    un array('Q') ordenado (leído del .ids) y se usa sin copiarlo
+    """
 
-    for base_path in possible_paths:
-        if not base_path.exists():
-            continue
+    def __init__(self, stored=(), presorted=False):
+        from array import array
+        from bisect import bisect_left
+        from hashlib import blake2b
+
+        self._bisect_left = bisect_left
+        self._blake2b = blake2b
+        self.stored = stored if presorted else array('Q', sorted(stored))
+        self.pending = array('Q')
+        self._pending_set = set()
+
+    def __len__(self):
+        return len(self.stored) + len(self.pending)
+
+    def add(self, key):
+        """Registra la clave; retorna False si el mensaje ya se había sumado"""
+        value = int.from_bytes(self._blake2b(key, digest_size=8).digest(), 'little')
+        if value in self._pending_set:
+            return False
+        stored = self.stored
+        if stored:
+            index = self._bisect_left(stored, value)
+            if index < len(stored) and stored[index] == value:
+                return False
+        self._pending_set.add(value)
+        self.pending.append(value)
+        return True
+
+    def merge(self):
+        """Pasa los ids pendientes a la parte ordenada (después de persistirlos)"""
+        from array import array
+
+        if self.pending:
+            if len(self.pending) * 64 < len(self.stored):
+                # Pocos ids nuevos: insertarlos en su lugar sale más barato
+                # que ordenar de nuevo todo el array
+                for value in sorted(self.pending):
+                    self.stored.insert(self._bisect_left(self.stored, value), value)
+            else:
+                self.stored = array('Q', sorted(self.stored + self.pending))
+            self.pending = array('Q')
+            self._pending_set = set()
+
+def iter_jsonl_lines(f, offset):
+    """
+    Recorre las líneas de f (abierto en binario) a partir de offset
+    Genera (line, head, oversized, line_start, line_length, complete)
 
-        # Buscar el archivo JSONL de esta sesión
-        for jsonl_file in base_path.rglob("*.jsonl"):
-            if session_id in jsonl_file.name:
-                return parse_jsonl_tokens(jsonl_file)
+    Se lee por bloques; de las líneas de más de MAX_LINE_BYTES solo se
+    conservan head (primeros bytes) y line (últimos bytes), así la memoria no
+    crece con el tamaño de las líneas. La última línea sin salto de línea se
+    genera con complete=False (salvo que sea gigante: esa no se genera)
+    """
+    # Los archivos comprimidos en streaming pueden no admitir seek: desde 0 no hace falta
+    if offset:
+        f.seek(offset)
+    line_start = offset
+    line_length = 0
+    pending = []      # partes de la línea actual (si no es gigante)
+    head = tail = b""  # extremos de la línea actual (si es gigante)
+    oversized = False
+
+    while True:
+        chunk = f.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+
+        pos = 0
+        while pos < len(chunk):
+            newline = chunk.find(b"\n", pos)
+            piece = chunk[pos:] if newline < 0 else chunk[pos:newline + 1]
+            pos += len(piece)
+            line_length += len(piece)
+
+            if oversized:
+                tail = (tail + piece)[-LINE_TAIL_BYTES:]
+            else:
+                pending.append(piece)
+                if line_length > MAX_LINE_BYTES:
+                    line = b"".join(pending)
+                    head, tail = line[:LINE_HEAD_BYTES], line[-LINE_TAIL_BYTES:]
+                    pending = []
+                    oversized = True
+
+            if newline < 0:
+                continue
+
+            # Línea completa
+            if oversized:
+                yield tail, head, True, line_start, line_length, True
+            else:
+                yield b"".join(pending), b"", False, line_start, line_length, True
+            line_start += line_length
+            line_length = 0
+            pending = []
+            head = tail = b""
+            oversized = False
+
+    if pending and not oversized:
+        yield b"".join(pending), b"", False, line_start, line_length, False
+
+def scan_jsonl_usage(f, offset, totals, seen=None):
+    """
+    Acumula en totals el usage de las líneas de f (abierto en binario)
+    a partir de offset. Retorna el offset hasta donde se consumió el archivo
+    Con seen (SeenMessages), un mensaje repetido en varias líneas se suma una vez
 
-    return 0, 0, 0, 0
+    Una última línea sin salto de línea puede estar escribiéndose todavía:
+    solo se consume si ya es JSON válido, si no se relee en la próxima pasada
+    Con presupuesto de latencia, se corta al vencer el deadline de la etapa
+    """
+    fd = _pread_fd(f)
+    end = offset
+    for count, (line, head, oversized, line_start, line_length, complete) in enumerate(iter_jsonl_lines(f, offset)):
+        if count % 256 == 255 and deadline_passed():
+            break
+        if not complete:
+            values = [0, 0, 0, 0]
+            if line.strip() and not _add_line_usage(line, values):
+                break
+        else:
+            values = _line_usage_values(line, head, fd if oversized else None, line_start, line_length)
+        end = line_start + line_length
+        if not any(values or ()):
+            continue
+        if seen is not None:
+            key = _line_message_key(line, head)
+            if key is not None and not seen.add(key):
+                continue
+        for index, value in enumerate(values):
+            totals[index] += value
+    return end
 
 def parse_jsonl_tokens(jsonl_path):
     """
     Parsea un archivo JSONL y suma todos los tokens
     """
-    total_input = 0
-    total_output = 0
-    total_cache_creation = 0
-    total_cache_read = 0
+    totals = [0, 0, 0, 0]
 
     try:
-        with open(jsonl_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if not line.strip():
+        with open_transcript(jsonl_path) as f:
+            scan_jsonl_usage(f, 0, totals, SeenMessages())
+    except Exception as e:
+        # Si hay error leyendo el archivo, retornar ceros
+        totals = [0, 0, 0, 0]
+
+    return tuple(totals)
+
+def read_last_usage(jsonl_path):
+    """
+    Retorna el usage del último mensaje del transcript (o None)
+    Mapea el archivo con mmap y busca '"usage"' hacia atrás desde el final:
+    el costo es proporcional a lo escrito después del último mensaje con
+    usage, no al tamaño del archivo
+    """
+    import mmap
+
+    try:
+        with open(jsonl_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = size
+                while end > 0:
+                    pos = mm.rfind(b'"usage"', 0, end)
+                    if pos < 0:
+                        return None
+
+                    line_start = mm.rfind(b"\n", 0, pos) + 1
+                    line_end = mm.find(b"\n", pos)
+                    if line_end < 0:
+                        line_end = size
+
+                    try:
+                        usage = _usage_from_entry(json.loads(mm[line_start:line_end]))
+                    except ValueError:
+                        # Línea a medio escribir: probar con la anterior
+                        usage = None
+                    if usage:
+                        return usage
+                    end = line_start
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+def get_session_context_tokens(session_id):
+    """
+    Tokens que ocupan hoy la ventana de contexto de la sesión: input + cache
+    creation + cache read del último mensaje del assistant
+    """
+    session = find_session(session_id)
+    if session is None:
+        return 0
+
+    if is_archived_transcript(session['path']):
+        return get_archive_summary(session['path'])['context']
+
+    usage = read_last_usage(session['path'])
+    if not usage:
+        return 0
+
+    return (usage.get('input_tokens', 0)
+            + usage.get('cache_creation_input_tokens', 0)
+            + usage.get('cache_read_input_tokens', 0))
+
+# --- Modo "block": bloque de facturación de 5 horas compartido por todas
+# las sesiones y proyectos del usuario ---
+
+BLOCK_SECONDS = 5 * 3600
+# Entradas que se conservan por archivo: la cadena de bloques sigue desde el
+# inicio guardado, así que solo hacen falta las del bloque activo y el
+# anterior (y, sin cadena guardada, para arrancarla)
+BLOCK_HISTORY_SECONDS = 2 * BLOCK_SECONDS
+# Con menos trabajo que esto el escaneo se hace en serie (crear el pool cuesta más)
+BLOCK_PARALLEL_MIN_FILES = 4
+BLOCK_PARALLEL_MIN_BYTES = 4 << 20
+# Hashes de los últimos mensajes de cada archivo que se guardan en el cache:
+# los chunks de un mismo mensaje van seguidos, pero pueden quedar repartidos
+# entre dos lecturas incrementales
+BLOCK_RECENT_IDS = 256
+
+_TIMESTAMP_RE = None
+# Cache en memoria (también en disco en block-cache.json): {"files": {ruta:
+# {inode, size, mtime_ns, offset, entries, ids}}, "chain": inicio del último bloque}
+_BLOCK_CACHE = None
+
+def _parse_timestamp(value):
+    """Convierte un timestamp ISO 8601 a epoch (o None)"""
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+def _line_timestamp(line, head=b"", fd=None, line_start=0, line_length=0):
+    """Timestamp de una línea con usage: regex de bytes o, si es ambiguo, JSON"""
+    global _TIMESTAMP_RE
+    if _TIMESTAMP_RE is None:
+        import re
+        _TIMESTAMP_RE = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+
+    matches = _TIMESTAMP_RE.findall(line)
+    if len(matches) == 1:
+        return _parse_timestamp(matches[0].decode('ascii', 'replace'))
+
+    if fd is not None:
+        line = os.pread(fd, line_length, line_start)
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    return _parse_timestamp(data.get('timestamp')) if isinstance(data, dict) else None
+
+def scan_block_entries(jsonl_path, offset, recent_ids=()):
+    """
+    Lee el JSONL desde offset y retorna (nuevo_offset, entradas, ids), donde
+    cada entrada es [epoch, tokens] con tokens = input + output + cache
+    creation, agregados por minuto para que el cache no crezca con cada
+    mensaje, e ids son los hashes de los últimos BLOCK_RECENT_IDS mensajes
+    (recent_ids son los de la lectura anterior)
+    Se ejecuta en los procesos del pool, por eso recibe y retorna datos simples
+    """
+    minutes = {}
+    end = offset
+    seen = SeenMessages(recent_ids)
+    try:
+        with open_transcript(jsonl_path) as f:
+            fd = _pread_fd(f)
+            for line, head, oversized, line_start, line_length, complete in iter_jsonl_lines(f, offset):
+                if not complete:
+                    break
+                end = line_start + line_length
+                line_fd = fd if oversized else None
+                values = _line_usage_values(line, head, line_fd, line_start, line_length)
+                if not values:
+                    continue
+                key = _line_message_key(line, head)
+                if key is not None and not seen.add(key):
                     continue
+                timestamp = _line_timestamp(line, head, line_fd, line_start, line_length)
+                if timestamp is not None:
+                    minute = timestamp - timestamp % 60
+                    minutes[minute] = minutes.get(minute, 0) + values[0] + values[1] + values[2]
+    except (OSError, EOFError):
+        pass
+    ids = (list(recent_ids) + seen.pending.tolist())[-BLOCK_RECENT_IDS:]
+    return end, [[minute, tokens] for minute, tokens in sorted(minutes.items())], ids
 
-                data = json.loads(line)
+def _list_recent_transcripts(since):
+    """(ruta, stat) de los transcripts de todas las raíces modificados desde since"""
+    refresh_session_index()
+    save_session_index()
 
-                # Extraer usage de diferentes ubicaciones posibles
-                usage = data.get('usage', {})
-                if not usage and 'message' in data:
-                    usage = data['message'].get('usage', {})
+    recent = []
+    for session in load_session_index()['sessions'].values():
+        path = session.get('path')
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            continue
+        if st.st_mtime >= since:
+            recent.append((path, st))
+    return recent
 
-                total_input += usage.get('input_tokens', 0)
-                total_output += usage.get('output_tokens', 0)
-                total_cache_creation += usage.get('cache_creation_input_tokens', 0)
-                total_cache_read += usage.get('cache_read_input_tokens', 0)
+def chain_blocks(entries, chain_start=None):
+    """
+    Encadena las entradas en bloques de 5 horas: un bloque empieza en la hora
+    entera de su primer mensaje y el primer mensaje a 5 horas o más de ese
+    inicio abre el siguiente. Con chain_start (inicio de un bloque ya
+    calculado en un render anterior) la cadena sigue desde ahí y las entradas
+    previas se ignoran. Retorna (inicio, tokens) del último bloque, o None
+    """
+    block_start = chain_start
+    total = 0
+    for timestamp, tokens in sorted(entries):
+        if chain_start is not None and timestamp < chain_start:
+            continue
+        if block_start is None or timestamp - block_start >= BLOCK_SECONDS:
+            block_start = timestamp - timestamp % 3600
+            total = 0
+        total += tokens
 
-    except Exception as e:
-        # Si hay error leyendo el archivo, retornar ceros
+    if block_start is None:
+        return None
+    return block_start, total
+
+def get_active_block():
+    """
+    Bloque de 5 horas activo considerando todos los proyectos: (inicio, tokens)
+    Los archivos modificados en las últimas 5 horas que cambiaron de tamaño se
+    escanean en paralelo con ProcessPoolExecutor, cada uno desde su offset
+
+    El inicio del último bloque queda en block-cache.json ('chain') y cada
+    render extiende la cadena desde ahí: con actividad continua el bloque no
+    se puede reconstruir desde una ventana acotada de entradas
+    """
+    global _BLOCK_CACHE
+    now = time.time()
+    cache_path = get_state_path("block-cache.json")
+    if _BLOCK_CACHE is None:
+        _BLOCK_CACHE = load_json_file(cache_path, {})
+        if not isinstance(_BLOCK_CACHE, dict) or not isinstance(_BLOCK_CACHE.get('files'), dict):
+            _BLOCK_CACHE = {'files': {}, 'chain': None}
+    files = _BLOCK_CACHE['files']
+
+    recent = _list_recent_transcripts(now - BLOCK_SECONDS)
+    recent_paths = {path for path, _ in recent}
+
+    # Qué archivos hay que (re)leer y desde dónde
+    jobs = []
+    for path, st in recent:
+        cached = files.get(path)
+        offset = transcript_resume_offset(cached, path, st)
+        if offset is None:
+            continue
+        if offset == 0:
+            cached = {'inode': st.st_ino, 'offset': 0, 'entries': [], 'ids': []}
+            files[path] = cached
+        cached['size'] = st.st_size
+        cached['mtime_ns'] = st.st_mtime_ns
+        jobs.append((path, offset, max(st.st_size - offset, 0)))
+
+    if jobs:
+        paths = [path for path, _, _ in jobs]
+        offsets = [offset for _, offset, _ in jobs]
+        recent_ids = [files[path].get('ids', []) for path in paths]
+        pending_bytes = sum(size for _, _, size in jobs)
+
+        results = None
+        if len(jobs) >= BLOCK_PARALLEL_MIN_FILES and pending_bytes >= BLOCK_PARALLEL_MIN_BYTES:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+                    results = list(pool.map(scan_block_entries, paths, offsets, recent_ids))
+            except (OSError, RuntimeError, ImportError):
+                results = None
+        if results is None:
+            results = [scan_block_entries(*job) for job in zip(paths, offsets, recent_ids)]
+
+        for path, (offset, entries, ids) in zip(paths, results):
+            files[path]['offset'] = offset
+            files[path]['entries'].extend(entries)
+            files[path]['ids'] = ids
+
+    # La cadena se extiende antes de descartar nada: las entradas que se
+    # descartan abajo ya quedan detrás de su inicio
+    all_entries = [entry for cached in files.values() for entry in cached['entries']]
+    block = chain_blocks(all_entries, _BLOCK_CACHE['chain'])
+    changed = bool(jobs)
+    if block is not None and block[0] != _BLOCK_CACHE['chain']:
+        _BLOCK_CACHE['chain'] = block[0]
+        changed = True
+
+    # Descartar archivos inactivos y entradas fuera del historial
+    cutoff = now - BLOCK_HISTORY_SECONDS
+    for path in list(files):
+        cached = files[path]
+        if path not in recent_paths:
+            del files[path]
+            changed = True
+            continue
+        kept = [entry for entry in cached['entries'] if entry[0] >= cutoff]
+        if len(kept) != len(cached['entries']):
+            cached['entries'] = kept
+            changed = True
+    if changed:
+        atomic_write_json(cache_path, _BLOCK_CACHE)
+
+    if block is None or now - block[0] >= BLOCK_SECONDS:
+        return None
+    return block
+
+# Checkpoints en memoria (session_id -> dict) para no releer el JSON de disco
+_CHECKPOINTS = {}
+
+def load_checkpoint(session_id):
+    """Checkpoint incremental de la sesión: inode, size, offset y totales"""
+    checkpoint = _CHECKPOINTS.get(session_id)
+    if checkpoint is None:
+        checkpoint = load_json_file(get_state_path("checkpoints", f"{session_id}.json"))
+        if isinstance(checkpoint, dict):
+            _CHECKPOINTS[session_id] = checkpoint
+        else:
+            checkpoint = None
+    return checkpoint
+
+def save_checkpoint(session_id, checkpoint):
+    """Guarda el checkpoint en memoria y en disco"""
+    _CHECKPOINTS[session_id] = checkpoint
+    atomic_write_json(get_state_path("checkpoints", f"{session_id}.json"), checkpoint)
+
+# Ids de mensajes vistos por sesión, en memoria (session_id -> SeenMessages)
+_SEEN_MESSAGES = {}
+
+def load_seen_messages(session_id, count):
+    """
+    Ids ya sumados de la sesión, de checkpoints/<sid>.ids: count hashes
+    ordenados, que se usan tal cual (sin ordenar en cada proceso)
+    Retorna None si el archivo no tiene exactamente count ids (quedó de una
+    escritura sin su checkpoint): los ids no corresponden al offset guardado
+    """
+    seen = _SEEN_MESSAGES.get(session_id)
+    if seen is not None and len(seen) == count and not seen.pending:
+        return seen
+
+    from array import array
+
+    stored = array('Q')
+    if count:
+        try:
+            with open(get_state_path("checkpoints", f"{session_id}.ids"), 'rb') as f:
+                stored.frombytes(f.read())
+        except (OSError, ValueError):
+            return None
+        if len(stored) != count:
+            return None
+    seen = SeenMessages(stored, presorted=True)
+    _SEEN_MESSAGES[session_id] = seen
+    return seen
+
+def save_seen_messages(session_id, seen):
+    """
+    Suma al .ids los hashes nuevos y lo reescribe ordenado (archivo temporal
+    + rename). Retorna la cantidad total a registrar en el checkpoint
+    """
+    if not seen.pending:
+        return len(seen)
+
+    seen.merge()
+    path = get_state_path("checkpoints", f"{session_id}.ids")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            seen.stored.tofile(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(seen)
+
+# Bytes antes del offset cuyo hash se guarda en el checkpoint: si cambiaron,
+# el archivo se reescribió (truncado y vuelto a crecer, por ejemplo)
+CHECKPOINT_FINGERPRINT_BYTES = 64
+
+def checkpoint_fingerprint(f, offset):
+    """Hash corto (hex) de los bytes que preceden a offset en el archivo abierto f"""
+    from hashlib import blake2b
+
+    start = max(offset - CHECKPOINT_FINGERPRINT_BYTES, 0)
+    f.seek(start)
+    return blake2b(f.read(offset - start), digest_size=8).hexdigest()
+
+def parse_jsonl_tokens_incremental(jsonl_path, session_id):
+    """
+    Como parse_jsonl_tokens, pero solo parsea los bytes agregados desde la
+    última llamada. Si el archivo fue truncado o reemplazado (otro inode,
+    tamaño menor al offset guardado, otros bytes antes del offset, o el
+    mismo tamaño con otro mtime) se vuelve a escanear desde el inicio
+    """
+    if is_archived_transcript(jsonl_path):
+        return get_archive_summary(jsonl_path)['totals']
+
+    try:
+        st = os.stat(jsonl_path)
+    except OSError:
+        return 0, 0, 0, 0
+
+    checkpoint = load_checkpoint(session_id)
+    resume = None
+    # Sin 'sorted_ids' o 'fingerprint' el checkpoint es de una versión anterior: se reescanea
+    if (checkpoint
+            and 'sorted_ids' in checkpoint
+            and 'fingerprint' in checkpoint
+            and checkpoint.get('path') == jsonl_path
+            and checkpoint.get('inode') == st.st_ino
+            and checkpoint.get('offset', 0) <= st.st_size):
+        if checkpoint.get('size') == st.st_size:
+            if checkpoint.get('mtime_ns') == st.st_mtime_ns:
+                return tuple(checkpoint['totals'])
+            # Mismo tamaño con otro mtime: reescrito en el lugar
+        else:
+            resume = checkpoint
+
+    try:
+        with open(jsonl_path, 'rb') as f:
+            offset = 0
+            totals = [0, 0, 0, 0]
+            seen = None
+            if resume and checkpoint_fingerprint(f, resume['offset']) == resume['fingerprint']:
+                seen = load_seen_messages(session_id, resume['sorted_ids'])
+            if seen is not None:
+                offset = resume['offset']
+                totals = list(resume['totals'])
+            else:
+                seen = load_seen_messages(session_id, 0)
+            f.seek(offset)
+            offset = scan_jsonl_usage(f, offset, totals, seen)
+            fingerprint = checkpoint_fingerprint(f, offset)
+        # Primero los ids y después el checkpoint que los cuenta
+        stored_ids = save_seen_messages(session_id, seen)
+    except OSError:
+        _SEEN_MESSAGES.pop(session_id, None)
+        return tuple(checkpoint['totals']) if resume else (0, 0, 0, 0)
+
+    # Se guarda el tamaño visto antes de leer: si el archivo creció durante
+    # la lectura, la próxima llamada nota la diferencia y continúa desde offset.
+    # Si la lectura se cortó por el deadline, sin tamaño: se retoma la próxima vez
+    save_checkpoint(session_id, {
+        'path': jsonl_path,
+        'inode': st.st_ino,
+        'size': None if deadline_passed() else st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'offset': offset,
+        'fingerprint': fingerprint,
+        'totals': totals,
+        'sorted_ids': stored_ids,
+    })
+    return tuple(totals)
+
+# --- Transcripts archivados: se descomprimen una sola vez y su resumen queda
+# para siempre en ~/.claude-code/archive-totals.json ---
+
+_ARCHIVE_CACHE = None
+
+def summarize_archive(path):
+    """
+    Una pasada por el archivo descomprimido: totales (deduplicados), tokens
+    de contexto del último mensaje (modo context) y epoch del primer timestamp
+    """
+    totals = [0, 0, 0, 0]
+    context = 0
+    start = None
+    seen = SeenMessages()
+    with open_transcript(path) as f:
+        for line, head, oversized, line_start, line_length, complete in iter_jsonl_lines(f, 0):
+            if start is None and (b'"timestamp"' in line or b'"timestamp"' in head):
+                start = _line_timestamp(line, head)
+            values = _line_usage_values(line, head)
+            if not values or not any(values):
+                continue
+            key = _line_message_key(line, head)
+            if key is not None and not seen.add(key):
+                continue
+            for index, value in enumerate(values):
+                totals[index] += value
+            context = values[0] + values[2] + values[3]
+    return {'totals': totals, 'context': context, 'start': start}
+
+def get_archive_summary(path):
+    """
+    Resumen de un transcript archivado ({"totals", "context", "start"})
+    Si el archivo no cambió (inode, tamaño, mtime) alcanza con un stat
+    """
+    global _ARCHIVE_CACHE
+    empty = {'totals': (0, 0, 0, 0), 'context': 0, 'start': None}
+    try:
+        st = os.stat(path)
+    except OSError:
+        return empty
+
+    cache_path = get_state_path("archive-totals.json")
+    if _ARCHIVE_CACHE is None:
+        _ARCHIVE_CACHE = load_json_file(cache_path, {})
+        if not isinstance(_ARCHIVE_CACHE, dict):
+            _ARCHIVE_CACHE = {}
+
+    entry = _ARCHIVE_CACHE.get(path)
+    if not (entry and entry.get('inode') == st.st_ino and entry.get('size') == st.st_size
+            and entry.get('mtime_ns') == st.st_mtime_ns):
+        try:
+            summary = summarize_archive(path)
+        except (OSError, EOFError, ValueError):
+            # Archivo dañado o sin módulo para descomprimirlo
+            return empty
+        entry = dict(summary, inode=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        _ARCHIVE_CACHE[path] = entry
+        atomic_write_json(cache_path, _ARCHIVE_CACHE)
+
+    return {'totals': tuple(entry['totals']), 'context': entry['context'], 'start': entry['start']}
+
+# --- Burn rate: muestras (timestamp, tokens acumulados) en un ring buffer
+# binario de tamaño fijo por sesión (~/.claude-code/burn/<clave>.bin) ---
+
+BURN_RING_SIZE = 64
+# Ventana para calcular el ritmo de consumo
+BURN_WINDOW_SECONDS = 600
+# Sin cambios de tokens, no se agregan muestras más seguido que esto
+BURN_MIN_INTERVAL = 60
+BURN_MAGIC = b"CSB1"
+# Cabecera: magic, próximo slot, cantidad de muestras; registro: epoch, tokens
+BURN_HEADER_FORMAT = "<4sII"
+BURN_RECORD_FORMAT = "<dq"
+# Escala de la serie "_web": el 100% de claude.ai equivale a 10000 unidades
+WEB_BURN_SCALE = 10000
+
+def prune_burn_samples(path, now):
+    """
+    Borra los ring buffers sin escrituras dentro de BURN_WINDOW_SECONDS:
+    ninguna de sus muestras entra en la ventana, así que no aportan al ritmo
+    y el directorio no crece con cada sesión que termina. path (el buffer
+    que se está escribiendo) se conserva siempre
+    """
+    try:
+        with os.scandir(os.path.dirname(path)) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".bin") or entry.path == path:
+                    continue
+                try:
+                    if now - entry.stat().st_mtime > BURN_WINDOW_SECONDS:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+    except OSError:
         pass
 
-    return total_input, total_output, total_cache_creation, total_cache_read
+def record_burn_sample(key, tokens, now=None):
+    """
+    Agrega una muestra al ring buffer de key y retorna las muestras vigentes
+    ordenadas [(epoch, tokens), ...]. Lee y escribe a lo sumo
+    BURN_RING_SIZE registros con pread/pwrite: O(1) y tamaño acotado
+    """
+    import struct
+
+    now = time.time() if now is None else now
+    header = struct.Struct(BURN_HEADER_FORMAT)
+    record = struct.Struct(BURN_RECORD_FORMAT)
+    path = get_state_path("burn", f"{key}.bin")
+
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    try:
+        data = os.pread(fd, header.size + BURN_RING_SIZE * record.size, 0)
+        head, count = 0, 0
+        if len(data) == header.size + BURN_RING_SIZE * record.size:
+            magic, head, count = header.unpack_from(data)
+            if magic != BURN_MAGIC or head >= BURN_RING_SIZE or count > BURN_RING_SIZE:
+                head, count = 0, 0
+
+        samples = [
+            record.unpack_from(data, header.size + ((head - count + i) % BURN_RING_SIZE) * record.size)
+            for i in range(count)
+        ]
+
+        if samples and tokens < samples[-1][1]:
+            # Los tokens bajaron (transcript reemplazado, nuevo bloque): reiniciar
+            head, count, samples = 0, 0, []
+
+        if not samples or tokens != samples[-1][1] or now - samples[-1][0] >= BURN_MIN_INTERVAL:
+            os.pwrite(fd, record.pack(now, tokens), header.size + head * record.size)
+            head = (head + 1) % BURN_RING_SIZE
+            count = min(count + 1, BURN_RING_SIZE)
+            os.pwrite(fd, header.pack(BURN_MAGIC, head, count), 0)
+            if len(data) < header.size + BURN_RING_SIZE * record.size:
+                # Archivo nuevo: reservar el tamaño completo y, ya que el
+                # directorio crece, limpiar los de sesiones inactivas
+                os.ftruncate(fd, header.size + BURN_RING_SIZE * record.size)
+                prune_burn_samples(path, now)
+            samples = (samples + [(now, tokens)])[-BURN_RING_SIZE:]
+    finally:
+        os.close(fd)
+
+    return samples
+
+def get_burn_rate(samples, now=None):
+    """Tokens por segundo en la ventana BURN_WINDOW_SECONDS (o None)"""
+    now = time.time() if now is None else now
+    recent = [sample for sample in samples if now - sample[0] <= BURN_WINDOW_SECONDS]
+    if len(recent) < 2:
+        return None
+
+    elapsed = recent[-1][0] - recent[0][0]
+    consumed = recent[-1][1] - recent[0][1]
+    if elapsed < 30 or consumed <= 0:
+        return None
+    return consumed / elapsed
+
+def project_exhaustion(key, tokens, limit):
+    """
+    Registra la muestra actual y proyecta el epoch en que, al ritmo de la
+    ventana reciente, se alcanzaría limit
+    Retorna (epoch, tokens por segundo); cada uno None si no es medible
+    """
+    now = time.time()
+    try:
+        samples = record_burn_sample(key, tokens, now)
+    except OSError:
+        return None, None
+
+    rate = get_burn_rate(samples, now)
+    if rate is None or tokens >= limit:
+        return None, rate
+    return now + (limit - tokens) / rate, rate
 
 def get_color_code(percentage):
     """
@@ -279,6 +1886,215 @@ def create_progress_bar(percentage, width):
     bar = color + ("░" * filled) + reset + ("▁" * empty)
     return bar
 
+# --- Snapshot para consumidores externos (tmux, polybar, prompts): el último
+# estado calculado, en un archivo binario de layout fijo que usage_snapshot.py
+# lee con mmap, sin parsear JSON ni tocar los transcripts ---
+
+SNAPSHOT_MAGIC = b"CSBS"
+SNAPSHOT_VERSION = 1
+# Cabecera: magic, versión, reservado y contador de secuencia (seqlock: es
+# impar mientras se escribe el cuerpo). Cuerpo: actualizado, reset, límite
+# proyectado (epochs), ritmo (tokens/s), tokens, límite, porcentaje, flags,
+# modo (índice en USAGE_MODES) y session_id. Los float desconocidos van en NaN
+# Debe coincidir con los formatos de usage_snapshot.py
+SNAPSHOT_HEADER_FORMAT = "<4sHHQ"
+SNAPSHOT_BODY_FORMAT = "<ddddqqHHB3x40s"
+SNAPSHOT_STALE_USAGE = 1
+SNAPSHOT_STALE_RESET = 2
+
+def publish_snapshot(state):
+    """
+    Escribe state en ~/.claude-code/status.snap, en el lugar (mismo inode)
+    Los escritores se serializan con flock; los lectores no bloquean nunca:
+    releen si el contador es impar o cambió mientras leían el cuerpo
+    """
+    import struct
+
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    header = struct.Struct(SNAPSHOT_HEADER_FORMAT)
+    body = struct.Struct(SNAPSHOT_BODY_FORMAT)
+    nan = float('nan')
+
+    def as_float(value):
+        return nan if value is None else float(value)
+
+    flags = ((SNAPSHOT_STALE_USAGE if state.get('stale_usage') else 0)
+             | (SNAPSHOT_STALE_RESET if state.get('stale_reset') else 0))
+    mode = state.get('mode')
+    payload = body.pack(
+        time.time(),
+        as_float(state.get('reset')),
+        as_float(state.get('limit_at')),
+        as_float(state.get('burn_rate')),
+        int(state.get('tokens') or 0),
+        int(state.get('limit') or 0),
+        min(max(int(state['percentage']), 0), 0xFFFF),
+        flags,
+        USAGE_MODES.index(mode) if mode in USAGE_MODES else 0xFF,
+        str(state.get('session_id') or '').encode('utf-8')[:40],
+    )
+
+    path = get_state_path("status.snap")
+    try:
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError:
+        return
+
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        seq = 0
+        data = os.pread(fd, header.size + body.size, 0)
+        if len(data) == header.size + body.size:
+            magic, version, _, seq = header.unpack_from(data)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                seq = 0
+        else:
+            # Archivo nuevo: tamaño completo antes de que un lector lo mapee
+            os.ftruncate(fd, header.size + body.size)
+
+        # Impar durante la escritura (si un escritor murió a mitad, ya lo es)
+        seq = seq + 1 if seq % 2 == 0 else seq + 2
+        os.pwrite(fd, header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, seq), 0)
+        os.pwrite(fd, payload, header.size)
+        os.pwrite(fd, header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, seq + 1), 0)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# --- Fuentes de datos de uso ---
+# Cada fuente recibe el JSON de la sesión y el modo, y retorna None (sin
+# datos) o {"percentage", "burn": (clave, tokens, límite), "window_start",
+# "reset", "tokens": (tokens, límite)}; "tokens" solo hace falta si no hay
+# "burn". Se consultan en orden de prioridad: la primera con datos gana
+
+def source_web(data, mode):
+    """PRIORIDAD 1: datos reales de claude.ai (el modo context no los usa)"""
+    if mode == "context":
+        return None
+
+    begin_stage("web")
+    percentage, _ = get_web_usage_data()
+    end_stage()
+    if percentage is None:
+        return None
+
+    # El porcentaje web es global: la serie del burn rate va en centésimas
+    # de punto (escala fija), no en tokens del límite de cada modelo, para
+    # que sesiones con modelos distintos no mezclen escalas en el ring
+    limit = get_context_limit(data.get('model', {}))
+    return {
+        'percentage': percentage,
+        'tokens': (percentage * limit // 100, limit),
+        'burn': ("_web", int(percentage * WEB_BURN_SCALE // 100), WEB_BURN_SCALE),
+    }
+
+def source_local(data, mode):
+    """PRIORIDAD 2: cálculo local desde los transcripts JSONL, según el modo"""
+    session_id = data.get('session_id', '')
+    model_info = data.get('model', {})
+
+    if mode == "context":
+        begin_stage("session_lookup")
+        find_session(session_id)
+        end_stage()
+
+        # Ocupación de la ventana: solo el usage del último mensaje
+        begin_stage("token_parse")
+        usage_tokens = get_session_context_tokens(session_id)
+        end_stage()
+        if usage_tokens == 0:
+            return None
+
+        window = get_context_window(model_info)
+        return {
+            'percentage': min(int((usage_tokens / window) * 100), 100),
+            'tokens': (usage_tokens, window),
+        }
+
+    if mode == "block":
+        # Bloque de 5 horas real: define el porcentaje y el reset
+        begin_stage("token_parse")
+        block = get_active_block()
+        end_stage()
+        if block is None or block[1] == 0:
+            return None
+
+        block_start, usage_tokens = block
+        limit = get_context_limit(model_info)
+        return {
+            'percentage': min(int((usage_tokens / limit) * 100), 100),
+            'burn': ("_block", usage_tokens, limit),
+            'window_start': block_start,
+            'reset': time.strftime('%H:%M', time.localtime(block_start + BLOCK_SECONDS)),
+        }
+
+    context_limit = get_context_limit(model_info)
+
+    begin_stage("session_lookup")
+    find_session(session_id)
+    end_stage()
+
+    # Leer tokens del archivo JSONL de la sesión
+    begin_stage("token_parse")
+    input_tokens, output_tokens, cache_creation, cache_read = get_session_tokens(session_id)
+    end_stage()
+
+    # Calcular total de tokens
+    usage_tokens = input_tokens + output_tokens + cache_creation
+    if usage_tokens == 0:
+        return None
+
+    return {
+        'percentage': min(int((usage_tokens / context_limit) * 100), 100),
+        'burn': (session_id, usage_tokens, context_limit),
+    }
+
+def source_stdin(data, mode):
+    """PRIORIDAD 3: campos directos del JSON de stdin (los de usage_bar_v2.py)"""
+    for field in ('current_tokens', 'expected_total_tokens', 'inputTokens'):
+        tokens = data.get(field)
+        if isinstance(tokens, (int, float)) and tokens > 0:
+            break
+    else:
+        return None
+
+    model_info = data.get('model', {})
+    limit = get_context_window(model_info) if mode == "context" else get_context_limit(model_info)
+    return {'percentage': min(int((tokens / limit) * 100), 100), 'tokens': (int(tokens), limit)}
+
+# Fuentes en orden de prioridad
+USAGE_SOURCES = (
+    ("web", source_web),
+    ("local", source_local),
+    ("stdin", source_stdin),
+)
+
+def resolve_usage(data, mode):
+    """
+    Resultado de la fuente de mayor prioridad que tenga datos (o None)
+    Fallback perezoso por prioridad: una fuente se consulta solo si las
+    anteriores no tuvieron datos, así no se descarta trabajo (con el cache
+    web al día, el JSONL no se lee). No hace falta correrlas en paralelo:
+    la web solo lee su cache (el refresco va en segundo plano) y la local
+    corta en un punto seguro al vencer su etapa del presupuesto
+    """
+    for _, source in USAGE_SOURCES:
+        result = source(data, mode)
+        if result is not None:
+            return result
+    return None
+
 def claude_usage_bar():
     """
     Función principal que Claude Code ejecuta para mostrar el status bar
@@ -286,54 +2102,81 @@ def claude_usage_bar():
     """
     try:
         # Leer JSON de stdin (Claude Code pasa datos de la sesión)
-        input_data = sys.stdin.read().strip()
+        begin_profile()
+        begin_stage("stdin")
+        input_data = sys.stdin.read()
+        end_stage()
+    except Exception as e:
+        end_profile()
+        return f"Claude Code (Error: {str(e)[:20]})"
+
+    return render_status_bar(input_data)
+
+def render_status_bar(input_data, terminal_width=None, mode=None):
+    """
+    Genera la línea del status bar a partir del JSON de la sesión
+    terminal_width permite que el daemon use el ancho de la terminal del cliente
+    mode: uno de USAGE_MODES (por defecto, el de get_usage_mode())
+    """
+    try:
+        begin_profile()
+        begin_budget()
+        input_data = input_data.strip()
         if not input_data:
             return ""
 
         data = json.loads(input_data)
 
-        # DEBUG: Guardar datos recibidos para análisis
-        debug_file = os.path.expanduser("~/.claude-code/statusbar-debug.json")
-        try:
-            with open(debug_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except:
-            pass
-
         # Extraer información de la sesión
         session_id = data.get('session_id', '')
         model_info = data.get('model', {})
 
-        # PRIORIDAD 1: Intentar obtener datos reales desde claude.ai
-        web_percentage, web_reset_time = get_web_usage_data()
-
-        if web_percentage is not None:
-            # Usar datos de la web (más precisos)
-            percentage = web_percentage
-            reset_time = web_reset_time if web_reset_time else calculate_session_reset(session_id)
-        else:
-            # FALLBACK: Calcular localmente si no hay datos de la web
-            context_limit = get_context_limit(model_info)
-
-            # Leer tokens del archivo JSONL de la sesión
-            input_tokens, output_tokens, cache_creation, cache_read = get_session_tokens(session_id)
-
-            # Calcular total de tokens
-            usage_tokens = input_tokens + output_tokens + cache_creation
-
-            # Si no hay datos de tokens, mostrar mensaje básico
-            if usage_tokens == 0:
-                plan = get_plan_name(model_info)
-                return f"Claude Code ({plan})"
-
-            # Calcular porcentaje de uso
-            percentage = min(int((usage_tokens / context_limit) * 100), 100)
-
-        # Calcular reset time desde el primer mensaje de la sesión
-        reset_time = calculate_session_reset(session_id)
+        if mode not in USAGE_MODES:
+            mode = get_usage_mode()
+
+        # Fuentes en orden de prioridad: claude.ai, JSONL local, campos de stdin
+        usage = resolve_usage(data, mode)
+        if usage is None:
+            plan = get_plan_name(model_info)
+            return f"Claude Code ({plan})"
+
+        percentage = usage['percentage']
+        block_reset = usage.get('reset')
+        window_start = usage.get('window_start')
+        # Serie para el burn rate: clave, tokens acumulados, límite e inicio
+        # de la ventana de 5 horas (el modo context no acumula: no aplica)
+        burn_key, burn_tokens, burn_limit = usage.get('burn') or (None, 0, 0)
+
+        # Calcular reset time: fin del bloque activo en modo block; si no,
+        # desde el primer mensaje de la sesión
+        begin_stage("reset")
+        if mode == "block" and block_reset is None:
+            # El porcentaje vino de claude.ai (o de stdin): el reset igual
+            # sale del bloque activo, no del inicio de esta sesión
+            block = get_active_block()
+            if block is not None:
+                window_start = block[0]
+                block_reset = time.strftime('%H:%M', time.localtime(block[0] + BLOCK_SECONDS))
+        reset_time = block_reset or calculate_session_reset(session_id)
+        if window_start is None:
+            window_start = get_session_start(session_id)
+        end_stage()
+
+        begin_stage("render")
+
+        # Proyección: a este ritmo, ¿se llega al límite antes del reset?
+        limit_time = None
+        exhaustion, burn_rate = None, None
+        if burn_key and window_start is not None:
+            exhaustion, burn_rate = project_exhaustion(burn_key, burn_tokens, burn_limit)
+            if exhaustion is not None and exhaustion >= window_start + BLOCK_SECONDS:
+                exhaustion = None
+            if exhaustion is not None:
+                limit_time = time.strftime('%H:%M', time.localtime(exhaustion))
 
         # Calcular ancho dinámico de la terminal
-        terminal_width = get_terminal_width()
+        if terminal_width is None:
+            terminal_width = get_terminal_width()
         if terminal_width < 50:
             terminal_width = 50
 
@@ -341,24 +2184,833 @@ def claude_usage_bar():
         color = get_color_code(percentage)
         reset_color = "\033[0m"
 
-        perc_str = f"{color}{percentage}%{reset_color}"
-        reset_display = f"Resets: {reset_time}"
+        # Valores que no llegaron a actualizarse dentro del presupuesto
+        stale_mark = STALE_GLYPH if is_stale("web", "session_lookup", "token_parse") else ""
+        reset_mark = STALE_GLYPH if is_stale("reset") else ""
+
+        perc_str = f"{color}{stale_mark}{percentage}%{reset_color}"
+        reset_display = f"Resets: {reset_mark}{reset_time}"
+        limit_display = f" Limit: {limit_time}" if limit_time else ""
 
         # Calcular ancho disponible para la barra
-        # Formato simplificado: "[bar] XX% Resets: HH:MM"
+        # Formato simplificado: "[bar] XX% Resets: HH:MM [Limit: HH:MM]"
         # Nota: Los códigos de color no cuentan para el ancho visual
-        fixed_width = 4 + len(f"{percentage}%") + 1 + len(reset_display)
+        fixed_width = 4 + len(f"{stale_mark}{percentage}%") + 1 + len(reset_display) + len(limit_display)
         bar_width = max(terminal_width - fixed_width, 10)
 
         # Crear barra de progreso
         progress_bar = create_progress_bar(percentage, bar_width)
 
-        # Retornar línea completa: [░░░░░▁▁▁] 77% Resets: 18:00
-        return f"[{progress_bar}] {perc_str} {reset_display}"
+        if limit_display:
+            limit_display = f"{get_color_code(100)}{limit_display}{reset_color}"
+
+        # El mismo estado, para tmux/polybar/prompts (usage_snapshot.py)
+        tokens, limit = usage.get('tokens') or (burn_tokens, burn_limit)
+        if burn_rate is not None and burn_limit and limit != burn_limit:
+            # Serie en otra escala (la web): el ritmo se publica en tokens
+            burn_rate = burn_rate * limit / burn_limit
+        publish_snapshot({
+            'percentage': percentage,
+            'tokens': tokens,
+            'limit': limit,
+            'reset': window_start + BLOCK_SECONDS if window_start is not None else None,
+            'limit_at': exhaustion,
+            'burn_rate': burn_rate,
+            'stale_usage': bool(stale_mark),
+            'stale_reset': bool(reset_mark),
+            'mode': mode,
+            'session_id': session_id,
+        })
+
+        end_stage()
+
+        # Retornar línea completa: [░░░░░▁▁▁] 77% Resets: 18:00 Limit: 16:40
+        return f"[{progress_bar}] {perc_str} {reset_display}{limit_display}"
 
     except Exception as e:
         # En caso de error, mostrar mensaje genérico
         return f"Claude Code (Error: {str(e)[:20]})"
+    finally:
+        end_budget()
+        end_profile()
+
+# --- Almacén columnar de uso (~/.claude-code/warehouse): una fila por
+# mensaje del assistant, un archivo binario por columna (array de tipo fijo) ---
+
+# Columna -> typecode de array (también válido como dtype de numpy)
+WAREHOUSE_COLUMNS = (
+    ("timestamp", "d"),
+    ("project", "I"),
+    ("session", "I"),
+    ("model", "I"),
+    ("input_tokens", "q"),
+    ("output_tokens", "q"),
+    ("cache_creation_input_tokens", "q"),
+    ("cache_read_input_tokens", "q"),
+)
+# Columnas con strings: se guardan como índice en un diccionario del manifest
+WAREHOUSE_DICTIONARIES = ("project", "session", "model")
+REPORT_GROUPS = ("project", "day", "model", "session")
+
+# Precios de lista aproximados en USD por millón de tokens:
+# (fragmento del modelo, input, output, cache creation, cache read)
+MODEL_PRICES = (
+    ("opus-4-5", 5.0, 25.0, 6.25, 0.50),
+    ("opus", 15.0, 75.0, 18.75, 1.50),
+    ("sonnet", 3.0, 15.0, 3.75, 0.30),
+    ("haiku-4-5", 1.0, 5.0, 1.25, 0.10),
+    ("haiku", 0.80, 4.0, 1.0, 0.08),
+)
+
+_MODEL_RE = None
+
+def get_model_prices(model):
+    """Precios (input, output, cache creation, cache read) del modelo, o None"""
+    model = (model or "").lower()
+    for fragment, *prices in MODEL_PRICES:
+        if fragment in model:
+            return prices
+    return None
+
+def _line_model(line, head=b""):
+    """Modelo de una línea con usage ("message.model"), como str o None"""
+    global _MODEL_RE
+    if _MODEL_RE is None:
+        import re
+        _MODEL_RE = re.compile(rb'"model"\s*:\s*"([^"]+)"')
+    model = _find_json_string(head or line, b'"model":"', _MODEL_RE)
+    return model.decode('utf-8', 'replace') if model else None
+
+def _warehouse_path(*parts):
+    return get_state_path("warehouse", *parts)
+
+def load_warehouse_manifest():
+    """
+    Manifest del almacén: filas válidas, ids de mensajes vistos, estado de
+    ingesta de cada transcript y diccionarios de las columnas de strings
+    """
+    manifest = load_json_file(_warehouse_path("manifest.json"), {})
+    if not isinstance(manifest, dict):
+        manifest = {}
+    manifest.setdefault('rows', 0)
+    manifest.setdefault('ids', 0)
+    manifest.setdefault('files', {})
+    dictionaries = manifest.setdefault('dictionaries', {})
+    for name in WAREHOUSE_DICTIONARIES:
+        dictionaries.setdefault(name, [])
+    return manifest
+
+def scan_usage_rows(jsonl_path, offset, seen):
+    """
+    Filas de uso del JSONL desde offset, con la misma lógica de campos que
+    parse_jsonl_tokens (incluida la deduplicación por message.id/requestId)
+    Retorna (nuevo_offset, [(epoch, modelo, [input, output, creation, read]), ...])
+    """
+    rows = []
+    end = offset
+    with open_transcript(jsonl_path) as f:
+        fd = _pread_fd(f)
+        for line, head, oversized, line_start, line_length, complete in iter_jsonl_lines(f, offset):
+            if not complete:
+                break
+            end = line_start + line_length
+            line_fd = fd if oversized else None
+            values = _line_usage_values(line, head, line_fd, line_start, line_length)
+            if not values or not any(values):
+                continue
+            key = _line_message_key(line, head)
+            if key is not None and not seen.add(key):
+                continue
+            timestamp = _line_timestamp(line, head, line_fd, line_start, line_length)
+            rows.append((timestamp or 0.0, _line_model(line, head), values))
+    return end, rows
+
+def ingest_usage_warehouse():
+    """
+    Agrega al almacén las líneas nuevas de todos los transcripts de las raíces
+    de proyectos. Cada archivo se lee desde su último offset; las columnas
+    solo crecen por el final y el manifest (escrito al último) dice cuántas
+    filas son válidas. Retorna el manifest actualizado
+    """
+    from array import array
+
+    manifest = load_warehouse_manifest()
+    files = manifest['files']
+    dictionaries = manifest['dictionaries']
+    lookups = {name: {value: i for i, value in enumerate(dictionaries[name])}
+               for name in WAREHOUSE_DICTIONARIES}
+
+    def intern(name, value):
+        index = lookups[name].get(value)
+        if index is None:
+            index = lookups[name][value] = len(dictionaries[name])
+            dictionaries[name].append(value)
+        return index
+
+    # Ids de mensajes de todo el almacén: una sesión retomada repite mensajes
+    ids_path = _warehouse_path("ids.u64")
+    stored = array('Q')
+    try:
+        with open(ids_path, 'rb') as f:
+            stored.frombytes(f.read(manifest['ids'] * stored.itemsize))
+    except (OSError, ValueError):
+        pass
+    if len(stored) != manifest['ids']:
+        stored = array('Q')
+        manifest['ids'] = 0
+    seen = SeenMessages(stored)
+
+    columns = {name: array(typecode) for name, typecode in WAREHOUSE_COLUMNS}
+    refresh_session_index()
+    save_session_index()
+    for session_id, session in load_session_index()['sessions'].items():
+        path = session.get('path')
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            continue
+
+        offset = transcript_resume_offset(files.get(path), path, st)
+        if offset is None:
+            continue
+
+        try:
+            offset, rows = scan_usage_rows(path, offset, seen)
+        except (OSError, EOFError):
+            continue
+        files[path] = {'inode': st.st_ino, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'offset': offset}
+        if not rows:
+            continue
+
+        project = intern('project', os.path.basename(os.path.dirname(path)))
+        session_index = intern('session', session_id)
+        for timestamp, model, values in rows:
+            columns['timestamp'].append(timestamp)
+            columns['project'].append(project)
+            columns['session'].append(session_index)
+            columns['model'].append(intern('model', model or "desconocido"))
+            columns['input_tokens'].append(values[0])
+            columns['output_tokens'].append(values[1])
+            columns['cache_creation_input_tokens'].append(values[2])
+            columns['cache_read_input_tokens'].append(values[3])
+
+    new_rows = len(columns['timestamp'])
+    os.makedirs(_warehouse_path(), exist_ok=True)
+    # Columnas e ids primero (descartando restos de una ingesta sin manifest)
+    for name, typecode in WAREHOUSE_COLUMNS:
+        with open(_warehouse_path(f"{name}.{typecode}"), 'ab') as f:
+            f.truncate(manifest['rows'] * columns[name].itemsize)
+            columns[name].tofile(f)
+    with open(ids_path, 'ab') as f:
+        f.truncate(manifest['ids'] * seen.pending.itemsize)
+        seen.pending.tofile(f)
+
+    manifest['rows'] += new_rows
+    manifest['ids'] = len(seen)
+    atomic_write_json(_warehouse_path("manifest.json"), manifest)
+    return manifest
+
+def load_warehouse_columns(manifest, numpy=None):
+    """Columnas del almacén (filas válidas): arrays de numpy o de array"""
+    from array import array
+
+    columns = {}
+    for name, typecode in WAREHOUSE_COLUMNS:
+        path = _warehouse_path(f"{name}.{typecode}")
+        if numpy is not None:
+            columns[name] = numpy.fromfile(path, dtype=numpy.dtype(typecode), count=manifest['rows'])
+            continue
+        column = array(typecode)
+        with open(path, 'rb') as f:
+            column.frombytes(f.read(manifest['rows'] * column.itemsize))
+        columns[name] = column
+    return columns
+
+# Todos los husos horarios (y sus cambios de horario) caen en múltiplos de
+# 15 minutos: +05:30, +05:45, +09:45... así un bucket nunca cruza medianoche
+DAY_BUCKET_SECONDS = 900
+
+def _local_days(buckets):
+    """Bucket UTC (epoch // DAY_BUCKET_SECONDS) -> fecha local "AAAA-MM-DD" (una llamada por bucket distinto)"""
+    return {bucket: time.strftime('%Y-%m-%d', time.localtime(bucket * DAY_BUCKET_SECONDS)) for bucket in buckets}
+
+def aggregate_usage(columns, manifest, group_by, since=None, numpy=None):
+    """
+    Suma los tokens por (grupo, modelo) y retorna
+    {grupo: {"messages", "tokens": [4 contadores], "cost"}}
+    Con numpy la agregación es vectorizada (bincount); sin numpy, un recorrido
+    en Python sobre los arrays
+    """
+    dictionaries = manifest['dictionaries']
+    models = dictionaries['model']
+    token_columns = [name for name, _ in WAREHOUSE_COLUMNS[4:]]
+    sums = {}   # (grupo, índice de modelo) -> [mensajes, 4 contadores]
+
+    if numpy is not None:
+        mask = slice(None) if since is None else columns['timestamp'] >= since
+        model_ids = columns['model'][mask]
+        if group_by == "day":
+            buckets, bucket_ids = numpy.unique(
+                (columns['timestamp'][mask] // DAY_BUCKET_SECONDS).astype('int64'), return_inverse=True)
+            days = _local_days(buckets.tolist())
+            labels = [days[bucket] for bucket in buckets.tolist()]
+            group_ids = bucket_ids
+        else:
+            group_ids = columns[group_by][mask]
+            labels = dictionaries[group_by]
+        # Un índice combinado (grupo, modelo) y bincount por contador
+        combined = group_ids.astype('int64') * max(len(models), 1) + model_ids
+        counts = numpy.bincount(combined)
+        totals = [numpy.bincount(combined, weights=columns[name][mask]) for name in token_columns]
+        for key in numpy.nonzero(counts)[0].tolist():
+            group, model = labels[key // max(len(models), 1)], key % max(len(models), 1)
+            entry = sums.setdefault((group, model), [0, 0, 0, 0, 0])
+            entry[0] += int(counts[key])
+            for index, column in enumerate(totals):
+                entry[index + 1] += int(column[key])
+    else:
+        timestamps = columns['timestamp']
+        groups = None if group_by == "day" else columns[group_by]
+        days = {}
+        token_arrays = [columns[name] for name in token_columns]
+        for row in range(len(timestamps)):
+            timestamp = timestamps[row]
+            if since is not None and timestamp < since:
+                continue
+            if groups is None:
+                bucket = int(timestamp // DAY_BUCKET_SECONDS)
+                group = days.get(bucket)
+                if group is None:
+                    group = days[bucket] = _local_days([bucket])[bucket]
+            else:
+                group = dictionaries[group_by][groups[row]]
+            entry = sums.get((group, columns['model'][row]))
+            if entry is None:
+                entry = sums[(group, columns['model'][row])] = [0, 0, 0, 0, 0]
+            entry[0] += 1
+            for index, column in enumerate(token_arrays):
+                entry[index + 1] += column[row]
+
+    report = {}
+    for (group, model), (messages, *tokens) in sums.items():
+        # Costo None: ningún modelo del grupo tiene precio conocido
+        result = report.setdefault(group, {'messages': 0, 'tokens': [0, 0, 0, 0], 'cost': None})
+        result['messages'] += messages
+        result['tokens'] = [a + b for a, b in zip(result['tokens'], tokens)]
+        prices = get_model_prices(models[model] if model < len(models) else None)
+        if prices is not None:
+            cost = sum(t * p for t, p in zip(tokens, prices)) / 1_000_000
+            result['cost'] = (result['cost'] or 0.0) + cost
+    return report
+
+def run_report(argv):
+    """
+    `usage_bar.py report [--by project|day|model|session] [--days N]`
+    Ingresa lo nuevo de los transcripts y muestra el uso agrupado con costo estimado
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="usage_bar.py report", description="Reporte de uso de tokens")
+    parser.add_argument("--by", choices=REPORT_GROUPS, default="day", help="agrupar por (por defecto: day)")
+    parser.add_argument("--days", type=float, help="solo los últimos N días")
+    parser.add_argument("--no-numpy", action="store_true", help="agregar en Python aunque numpy esté instalado")
+    args = parser.parse_args(argv)
+
+    numpy = None
+    if not args.no_numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    manifest = ingest_usage_warehouse()
+    if not manifest['rows']:
+        print("Sin datos de uso en los transcripts")
+        return 1
+
+    since = time.time() - args.days * 86400 if args.days else None
+    report = aggregate_usage(load_warehouse_columns(manifest, numpy), manifest, args.by, since, numpy)
+
+    if args.by == "day":
+        groups = sorted(report)
+    else:
+        groups = sorted(report, key=lambda group: -sum(report[group]['tokens']))
+
+    header = (f"{args.by:<28}{'mensajes':>10}{'input':>14}{'output':>14}"
+              f"{'cache write':>14}{'cache read':>16}{'costo USD':>12}")
+    print(header)
+    print("-" * len(header))
+    total = {'messages': 0, 'tokens': [0, 0, 0, 0], 'cost': None}
+    for group in groups + ["TOTAL"]:
+        row = total if group == "TOTAL" else report[group]
+        if group == "TOTAL":
+            print("-" * len(header))
+        else:
+            total['messages'] += row['messages']
+            total['tokens'] = [a + b for a, b in zip(total['tokens'], row['tokens'])]
+            if row['cost'] is not None:
+                total['cost'] = (total['cost'] or 0.0) + row['cost']
+        cost = "-" if row['cost'] is None else f"{row['cost']:,.2f}"
+        print(f"{str(group)[-28:]:<28}{row['messages']:>10,}{row['tokens'][0]:>14,}{row['tokens'][1]:>14,}"
+              f"{row['tokens'][2]:>14,}{row['tokens'][3]:>16,}{cost:>12}")
+    return 0
+
+# --- Modo --top: tablero en vivo de todas las sesiones recientes ---
+
+TOP_HOURS = float(os.environ.get("CLAUDE_STATUSBAR_TOP_HOURS", "5"))
+TOP_REFRESH_SECONDS = 1.0
+# Cada cuántos refrescos se vuelve a recorrer el árbol buscando sesiones nuevas
+TOP_RESCAN_EVERY = 5
+
+def read_last_model(jsonl_path):
+    """Modelo del último mensaje del assistant (mmap + rfind, como read_last_usage)"""
+    import mmap
+
+    if is_archived_transcript(jsonl_path):
+        return None
+    try:
+        with open(jsonl_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = mm.rfind(b'"model":"')
+                if pos < 0:
+                    return None
+                start = pos + len(b'"model":"')
+                end = mm.find(b'"', start, start + 200)
+                if end < 0:
+                    return None
+                return mm[start:end].decode('utf-8', 'replace')
+    except (OSError, ValueError):
+        return None
+
+def _top_update_row(row, path, st, now):
+    """Relee tokens, modelo e inicio de una sesión cuyo tamaño cambió"""
+    session_id = _session_id_from_filename(os.path.basename(path))
+    input_tokens, output_tokens, cache_creation, _ = parse_jsonl_tokens_incremental(path, session_id)
+    row['tokens'] = input_tokens + output_tokens + cache_creation
+    row['size'] = st.st_size
+    model = read_last_model(path)
+    if model:
+        row['model'] = {'id': model}
+    if row.get('start') is None:
+        row['start'] = get_session_start(session_id)
+    try:
+        row['samples'] = record_burn_sample(session_id, row['tokens'], now)
+    except OSError:
+        pass
+    row['sampled'] = now
+
+def _top_format_row(row, now):
+    """Línea de la tabla para una sesión (con colores, sin salto de línea)"""
+    limit = get_context_limit(row.get('model'))
+    percentage = min(int(row['tokens'] * 100 / limit), 100) if limit else 0
+    rate = get_burn_rate(row.get('samples', []), now)
+    rate_str = f"{rate * 60:,.0f}/min" if rate else "-"
+    start = row.get('start')
+    reset_str = time.strftime('%H:%M', time.localtime(start + BLOCK_SECONDS)) if start else "--:--"
+    project = os.path.basename(os.path.dirname(row['path']))[-24:]
+    color = get_color_code(percentage)
+    return (f"{row['session_id'][:8]:<9}{project:<25}{row['tokens']:>12,} "
+            f"{color}{percentage:>5}%\033[0m {rate_str:>12} {reset_str:>7}")
+
+def run_top(hours=None):
+    """
+    `usage_bar.py --top [HORAS]`: lista las sesiones con actividad en las
+    últimas HORAS (CLAUDE_STATUSBAR_TOP_HOURS, por defecto 5) y se refresca
+    cada segundo. En cada vuelta solo se relee un transcript si cambió su
+    tamaño, y solo se redibujan las filas que cambiaron (movimiento de
+    cursor ANSI, sin limpiar la pantalla)
+    """
+    hours = TOP_HOURS if hours is None else hours
+    rows = {}          # ruta -> estado de la sesión
+    recent = []
+    screen = []        # líneas actualmente dibujadas
+    out = sys.stdout
+    cycle = 0
+
+    # Pantalla alternativa y cursor oculto mientras dure el tablero
+    out.write("\033[?1049h\033[?25l\033[2J")
+    try:
+        while True:
+            now = time.time()
+            if cycle % TOP_RESCAN_EVERY == 0:
+                recent = [path for path, _ in _list_recent_transcripts(now - hours * 3600)]
+            cycle += 1
+
+            active = []
+            for path in recent:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_mtime < now - hours * 3600:
+                    continue
+                row = rows.get(path)
+                if row is None:
+                    row = rows[path] = {
+                        'path': path,
+                        'session_id': _session_id_from_filename(os.path.basename(path)),
+                        'size': None,
+                        'tokens': 0,
+                    }
+                row['mtime'] = st.st_mtime
+                if row['size'] != st.st_size or now - row.get('sampled', 0) >= BURN_MIN_INTERVAL:
+                    _top_update_row(row, path, st, now)
+                active.append(row)
+
+            for path in set(rows) - {row['path'] for row in active}:
+                del rows[path]
+
+            try:
+                height = os.get_terminal_size().lines
+            except OSError:
+                height = 24
+            active.sort(key=lambda row: row['mtime'], reverse=True)
+            shown = active[:max(height - 3, 1)]
+
+            lines = [
+                f"Sesiones activas (últimas {hours:g} h): {len(active)}   {time.strftime('%H:%M:%S')}",
+                f"{'SESIÓN':<9}{'PROYECTO':<25}{'TOKENS':>12} {'LÍMITE':>6} {'RITMO':>12} {'RESET':>7}",
+            ] + [_top_format_row(row, now) for row in shown]
+
+            # Redibujar solo las líneas distintas; borrar las que sobran
+            for i, line in enumerate(lines):
+                if i >= len(screen) or screen[i] != line:
+                    out.write(f"\033[{i + 1};1H{line}\033[K")
+            for i in range(len(lines), len(screen)):
+                out.write(f"\033[{i + 1};1H\033[K")
+            screen = lines
+            out.flush()
+
+            time.sleep(TOP_REFRESH_SECONDS)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        out.write("\033[?25h\033[?1049l")
+        out.flush()
+
+# --- Precalentamiento (hook SessionStart de Claude Code): deja listo el
+# estado que necesita el primer render antes de que el usuario lo espere ---
+
+# En una sesión nueva el transcript aparece recién con el primer mensaje
+PREWARM_WAIT_SECONDS = 30
+PREWARM_POLL_SECONDS = 0.25
+
+def run_prewarm():
+    """
+    `usage_bar.py --prewarm`: lee el JSON del hook SessionStart
+    ({"session_id", "transcript_path", ...}) y delega el trabajo en un proceso
+    desacoplado, para no demorar el arranque de la sesión
+    No imprime nada: la salida de un hook SessionStart se agrega al contexto
+    """
+    try:
+        data = json.loads(sys.stdin.read() or "{}")
+    except ValueError:
+        return 0
+    if not isinstance(data, dict) or not data.get('session_id'):
+        return 0
+
+    import subprocess
+
+    try:
+        os.makedirs(get_state_path(), exist_ok=True)
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--prewarm-session",
+             str(data['session_id']), str(data.get('transcript_path') or "")],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
+    return 0
+
+def prewarm_session(session_id, transcript_path=None):
+    """
+    Registra el transcript en el índice, guarda el inicio de la sesión,
+    siembra el checkpoint de tokens y refresca el cache web
+    Si el transcript todavía no tiene mensajes se espera hasta
+    PREWARM_WAIT_SECONDS a que aparezca el primero
+    """
+    global _SESSION_INDEX_DIRTY
+
+    # El cache web no depende del transcript: se refresca mientras tanto
+    spawn_web_usage_refresh()
+    if os.environ.get("CLAUDE_STATUSBAR_DAEMON") == "1":
+        spawn_daemon()
+
+    path = os.path.expanduser(transcript_path) if transcript_path else None
+    deadline = time.monotonic() + PREWARM_WAIT_SECONDS
+    while True:
+        if path and os.path.exists(path):
+            # Ruta conocida: no hace falta recorrer el árbol de proyectos
+            session = load_session_index()['sessions'].setdefault(session_id, {})
+            if session.get('path') != path:
+                session['path'] = path
+                session.pop('start', None)
+                _SESSION_INDEX_DIRTY = True
+        if get_session_start(session_id) is not None:
+            break
+        if time.monotonic() >= deadline:
+            save_session_index()
+            return 0
+        time.sleep(PREWARM_POLL_SECONDS)
+
+    session = find_session(session_id)
+    if session is not None:
+        parse_jsonl_tokens_incremental(session['path'], session_id)
+        if get_usage_mode() == "block":
+            get_active_block()
+    return 0
+
+def get_socket_path():
+    """Socket Unix donde escucha el daemon (`usage_bar.py --daemon`)"""
+    return get_state_path("usage_bar.sock")
+
+class SessionWatcher:
+    """
+    Watcher de inotify (Linux, vía ctypes) sobre los directorios de proyectos
+    Cuando se agregan bytes a un transcript actualiza sus totales con
+    parse_jsonl_tokens_incremental() (mismos números que get_session_tokens)
+    y registra en el índice las sesiones nuevas apenas aparece su archivo
+    Así un render del daemon responde sin tocar el disco
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+    def __init__(self, lock):
+        import ctypes
+        import ctypes.util
+
+        self.lock = lock
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.watches = {}  # wd -> directorio
+        self.watched = set()  # directorios vigilados
+
+    def watches_dir(self, dir_path):
+        """True si dir_path tiene un watch activo"""
+        return dir_path in self.watched
+
+    def add_tree(self, root):
+        """Vigila root y todos sus subdirectorios"""
+        pending = [root]
+        while pending:
+            dir_path = pending.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+            if wd < 0:
+                continue
+            self.watches[wd] = dir_path
+            self.watched.add(dir_path)
+            try:
+                with os.scandir(dir_path) as it:
+                    for dir_entry in it:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            pending.append(dir_entry.path)
+                        elif _session_id_from_filename(dir_entry.name):
+                            with self.lock:
+                                self._register(dir_entry.path)
+            except OSError:
+                pass
+
+    def _register(self, path):
+        """Agrega al índice en memoria la sesión de un archivo nuevo"""
+        global _SESSION_INDEX_DIRTY
+        session_id = _session_id_from_filename(os.path.basename(path))
+        session = load_session_index()['sessions'].setdefault(session_id, {})
+        if session.get('path') != path:
+            session['path'] = path
+            _SESSION_INDEX_DIRTY = True
+        return session_id
+
+    def _read_events(self):
+        """Bloquea hasta recibir eventos; retorna lista de (wd, mask, nombre)"""
+        import struct
+
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from("iIII", data, pos)
+            name = data[pos + 16:pos + 16 + length].rstrip(b"\0")
+            events.append((wd, mask, os.fsdecode(name)))
+            pos += 16 + length
+        return events
+
+    def run(self):
+        """Loop del thread: procesa eventos por lotes"""
+        while True:
+            try:
+                events = self._read_events()
+            except OSError:
+                return
+
+            changed = set()
+            new_dirs = []
+            with self.lock:
+                for wd, mask, name in events:
+                    if mask & self.IN_Q_OVERFLOW:
+                        # Se perdieron eventos: volver a leer de disco
+                        _LIVE_TOTALS.clear()
+                        continue
+                    if mask & self.IN_IGNORED:
+                        dir_path = self.watches.pop(wd, None)
+                        if dir_path not in self.watches.values():
+                            self.watched.discard(dir_path)
+                        continue
+                    dir_path = self.watches.get(wd)
+                    if dir_path is None or not name:
+                        continue
+                    path = os.path.join(dir_path, name)
+                    if mask & self.IN_ISDIR:
+                        if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                            new_dirs.append(path)
+                        continue
+                    session_id = _session_id_from_filename(name)
+                    if not session_id:
+                        continue
+                    if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        _LIVE_TOTALS.pop(session_id, None)
+                        changed.discard(path)
+                        continue
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        self._register(path)
+                    changed.add(path)
+
+                for path in changed:
+                    session_id = _session_id_from_filename(os.path.basename(path))
+                    _LIVE_TOTALS[session_id] = (path, parse_jsonl_tokens_incremental(path, session_id))
+
+            for dir_path in new_dirs:
+                self.add_tree(dir_path)
+
+def start_session_watcher(lock):
+    """
+    Arranca el watcher en un thread (solo Linux). Retorna False si inotify
+    no está disponible; en ese caso los renders leen de disco como siempre
+    """
+    global _WATCHER
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import threading
+
+    try:
+        watcher = SessionWatcher(lock)
+    except (OSError, AttributeError):
+        return False
+
+    for root in get_project_roots():
+        if os.path.isdir(root):
+            watcher.add_tree(root)
+
+    _WATCHER = watcher
+    threading.Thread(target=watcher.run, name="session-watcher", daemon=True).start()
+    return True
+
+def run_daemon():
+    """
+    Daemon residente: mantiene en memoria el índice de sesiones, los
+    checkpoints de tokens y el cache web, y atiende renders por un socket Unix
+    Protocolo: el cliente envía "<ancho> <modo>\n<json de stdin>", cierra
+    la escritura y recibe la línea del status bar
+    """
+    import fcntl
+    import signal
+    import socket
+    import socketserver
+    import threading
+
+    # Un solo daemon por usuario: el lock se mantiene mientras el proceso vive
+    lock_file = open(get_state_path("usage_bar.daemon.lock"), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return 1
+
+    render_lock = threading.Lock()
+
+    # Opcional: totales en vivo con inotify (CLAUDE_STATUSBAR_WATCH=1)
+    if os.environ.get("CLAUDE_STATUSBAR_WATCH") == "1":
+        start_session_watcher(render_lock)
+
+    class RenderHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.request.settimeout(5)
+            header = self.rfile.readline().decode('ascii', 'replace').split()
+            payload = self.rfile.read()
+            width = int(header[0]) if header and header[0].isdigit() else None
+            mode = header[1] if len(header) > 1 else None
+            # El estado compartido (índice, checkpoints) no es thread-safe
+            with render_lock:
+                line = render_status_bar(payload.decode('utf-8', 'replace'), width, mode)
+                self.wfile.write(line.encode('utf-8'))
+                # El cliente lee hasta EOF: se cierra la escritura ya
+                try:
+                    self.connection.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+
+    socket_path = get_socket_path()
+    try:
+        os.unlink(socket_path)
+    except OSError:
+        pass
+
+    old_umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(socket_path, RenderHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+
+    # SIGTERM cierra el servidor limpiamente (y borra el socket)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+    return 0
+
+def spawn_daemon():
+    """Lanza el daemon como proceso desacoplado (si ya hay uno, termina solo)"""
+    import subprocess
+
+    try:
+        os.makedirs(get_state_path(), exist_ok=True)
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
 
 # --- IMPORTANTE: No modificar esta línea ---
 # Claude Code busca exactamente esta función para el status bar
@@ -366,6 +3018,29 @@ __claude_code_status_bar__ = claude_usage_bar
 
 # Permitir ejecución directa para pruebas
 if __name__ == "__main__":
+    if sys.argv[1:] == ["--refresh-web-cache"]:
+        refresh_web_usage_cache()
+        sys.exit(0)
+
+    if sys.argv[1:2] == ["report"]:
+        sys.exit(run_report(sys.argv[2:]))
+
+    if sys.argv[1:] == ["--stats"]:
+        sys.exit(print_stats())
+
+    if sys.argv[1:2] == ["--top"]:
+        sys.exit(run_top(float(sys.argv[2]) if len(sys.argv) > 2 else None))
+
+    if sys.argv[1:] == ["--prewarm"]:
+        sys.exit(run_prewarm())
+
+    if sys.argv[1:2] == ["--prewarm-session"] and len(sys.argv) > 2:
+        sys.exit(prewarm_session(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+
+    if sys.argv[1:] == ["--daemon"]:
+        os.makedirs(get_state_path(), exist_ok=True)
+        sys.exit(run_daemon())
+
     result = claude_usage_bar()
     if result:
         print(result)
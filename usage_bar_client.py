@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# ~/.claude-code/scripts/usage_bar_client.py
+"""
+Cliente liviano del daemon de usage_bar.py
+Reenvía el JSON de stdin por el socket Unix e imprime la respuesta
+Si el daemon no está corriendo, renderiza en el mismo proceso con usage_bar.py
+"""
+import os
+import sys
+# _socket (el módulo C) en vez de socket: este último importa enum y
+# selectors, que cuestan más que todo el resto del arranque
+import _socket
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".claude-code", "usage_bar.sock")
+
+def get_terminal_width():
+    """Mismo criterio que shutil.get_terminal_size(), sin importar shutil"""
+    try:
+        return int(os.environ["COLUMNS"])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return os.get_terminal_size(sys.__stdout__.fileno()).columns
+    except (AttributeError, ValueError, OSError):
+        return 80
+
+def render_via_daemon(payload, width, mode):
+    """Envía el render al daemon; lanza OSError si no está disponible"""
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.settimeout(2)
+        sock.connect(SOCKET_PATH)
+        sock.sendall(f"{width} {mode}\n".encode() + payload)
+        sock.shutdown(_socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        sock.close()
+    return b"".join(chunks).decode('utf-8', 'replace')
+
+def render_in_process(payload, width, mode):
+    """Fallback: importa usage_bar.py (mismo directorio) y renderiza aquí"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import usage_bar
+
+    result = usage_bar.render_status_bar(payload.decode('utf-8', 'replace'), width, mode)
+
+    # Opcional: levantar el daemon para los próximos renders
+    if os.environ.get("CLAUDE_STATUSBAR_DAEMON") == "1":
+        usage_bar.spawn_daemon()
+    return result
+
+def main():
+    payload = sys.stdin.buffer.read()
+    width = get_terminal_width()
+    # El modo se toma del entorno del cliente (el daemon puede tener otro)
+    mode = os.environ.get("CLAUDE_STATUSBAR_MODE", "cumulative").lower()
+
+    try:
+        result = render_via_daemon(payload, width, mode)
+    except OSError:
+        result = render_in_process(payload, width, mode)
+
+    if result:
+        print(result)
+
+if __name__ == "__main__":
+    main()
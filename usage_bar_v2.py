@@ -97,35 +97,211 @@ def create_progress_bar(percentage, width):
     empty = width - filled
     return "█" * filled + "░" * empty
 
-def get_token_usage_from_transcript(transcript_path):
+# Campos de usage que se suman en un transcript JSONL (usage o message.usage)
+# cache_read no entra: cada turno vuelve a leer el prefijo cacheado y sumarlo
+# contaría el mismo contexto una vez por mensaje (igual que usage_bar.py)
+INPUT_USAGE_INDEXES = (0, 2)   # input_tokens, cache_creation_input_tokens
+OUTPUT_USAGE_INDEXES = (1,)    # output_tokens
+
+# Transcripts JSON: se decodifican de a un mensaje, leyendo por bloques
+JSON_CHUNK_CHARS = 1 << 16
+
+def _usage_bar():
+    """usage_bar.py (mismo directorio): su lector de JSONL acota la memoria por línea"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import usage_bar
+    return usage_bar
+
+def scan_transcript_lines(f, offset):
     """
-    Lee el transcript de la sesión actual y calcula el uso de tokens
+    Suma los tokens de las líneas de un transcript JSONL (f en binario) desde
+    offset con scan_jsonl_usage de usage_bar.py: las líneas sin usage no se
+    parsean y las gigantes no se cargan enteras. Retorna (nuevo_offset, input,
+    output); una última línea a medio escribir queda para la próxima pasada
+    """
+    totals = [0, 0, 0, 0]
+    offset = _usage_bar().scan_jsonl_usage(f, offset, totals)
+    return (offset,
+            sum(totals[index] for index in INPUT_USAGE_INDEXES),
+            sum(totals[index] for index in OUTPUT_USAGE_INDEXES))
+
+class _JsonStream:
+    """Texto JSON leído por bloques: decodifica de a un valor sin cargar el archivo"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size):
+        chunk = self.f.read(size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self):
+        """Próximo carácter que no sea espacio ("" al final del archivo)"""
+        while True:
+            self.pos = json.decoder.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(JSON_CHUNK_CHARS):
+                return ""
+
+    def take(self, char):
+        if self.peek() != char:
+            raise ValueError(f"se esperaba {char!r}")
+        self.pos += 1
+
+    def more(self, close):
+        """Salta la coma entre elementos; al llegar a close lo consume y retorna False"""
+        char = self.peek()
+        if char == ",":
+            self.pos += 1
+            char = self.peek()
+        if char == close:
+            self.pos += 1
+            return False
+        if not char:
+            raise ValueError("JSON incompleto")
+        return True
+
+    def value(self):
+        """Decodifica el valor que empieza en la posición actual (ya sin espacios)"""
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Leer al menos lo que ya hay en el buffer: un mensaje enorme
+                # se reintenta O(log n) veces, no una por bloque
+                if not self._fill(max(JSON_CHUNK_CHARS, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # Un número al final del buffer puede seguir en el próximo bloque
+            if end == len(self.buf) and self._fill(JSON_CHUNK_CHARS):
+                continue
+            self.pos = end
+            return value
+
+def walk_json_messages(f):
+    """
+    Transcript JSON de un solo documento: {"messages": [{"inputTokens", "outputTokens"}, ...]}
+    Recorre la lista de mensajes de a uno y conserva solo los contadores
+    Retorna (input, output), o None si el primer objeto del archivo no tiene
+    una lista "messages" (el transcript es un JSONL)
     """
+    stream = _JsonStream(f)
+    stream.take("{")
+    while stream.more("}"):
+        key = stream.value()
+        stream.take(":")
+        if key == "messages" and stream.peek() == "[":
+            stream.take("[")
+            total_input_tokens = 0
+            total_output_tokens = 0
+            while stream.more("]"):
+                message = stream.value()
+                if isinstance(message, dict):
+                    # Sumar tokens de input (user + context)
+                    total_input_tokens += message.get('inputTokens', 0)
+                    # Sumar tokens de output (assistant)
+                    total_output_tokens += message.get('outputTokens', 0)
+            return total_input_tokens, total_output_tokens
+        stream.peek()
+        stream.value()
+    return None
+
+# Transcripts recordados en v2-transcript-cache.json (una entrada por sesión)
+V2_CACHE_MAX_ENTRIES = 64
+
+def load_transcript_cache():
+    """Cache de totales por transcript: {ruta: {inode, size, mtime_ns, input, output}}"""
+    cache_file = os.path.expanduser("~/.claude-code/v2-transcript-cache.json")
     try:
-        if not os.path.exists(transcript_path):
-            return None, None
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
-        with open(transcript_path, 'r') as f:
-            transcript = json.load(f)
+def save_transcript_cache(cache):
+    """
+    Guarda el cache de forma atómica (archivo temporal + rename)
+    Conserva solo los V2_CACHE_MAX_ENTRIES transcripts modificados más recientemente
+    """
+    if len(cache) > V2_CACHE_MAX_ENTRIES:
+        recent = sorted(cache, key=lambda path: cache[path].get('mtime_ns', 0), reverse=True)
+        cache = {path: cache[path] for path in recent[:V2_CACHE_MAX_ENTRIES]}
 
-        # Contar tokens de todos los mensajes
-        total_input_tokens = 0
-        total_output_tokens = 0
+    cache_file = os.path.expanduser("~/.claude-code/v2-transcript-cache.json")
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
 
-        for message in transcript.get('messages', []):
-            # Sumar tokens de input (user + context)
-            if 'inputTokens' in message:
-                total_input_tokens += message['inputTokens']
+def get_token_usage_from_transcript(transcript_path):
+    """
+    Lee el transcript de la sesión actual y calcula el uso de tokens
+    Un JSONL se lee desde el offset guardado en el cache: cada render solo
+    parsea las líneas nuevas. Un transcript JSON ({"messages": [...]}) se
+    recorre de a un mensaje, solo si cambió (inode, tamaño y mtime)
+    """
+    try:
+        st = os.stat(transcript_path)
+    except OSError:
+        return None, None
 
-            # Sumar tokens de output (assistant)
-            if 'outputTokens' in message:
-                total_output_tokens += message['outputTokens']
+    cache = load_transcript_cache()
+    cached = cache.get(transcript_path)
+    if not (cached and cached.get('inode') == st.st_ino
+            and cached.get('offset', 0) <= st.st_size):
+        cached = None
+    if (cached and cached.get('size') == st.st_size
+            and cached.get('mtime_ns') == st.st_mtime_ns):
+        return cached['input'], cached['output']
 
-        # El total usado es principalmente los input tokens (que incluyen el contexto)
-        return total_input_tokens, total_output_tokens
+    try:
+        if cached and cached.get('format') == 'jsonl' and cached.get('size') != st.st_size:
+            # Creció: solo las líneas agregadas
+            offset, total_input_tokens, total_output_tokens = cached['offset'], cached['input'], cached['output']
+            transcript_format = 'jsonl'
+        else:
+            # Primera lectura (o reescrito): el primer objeto dice el formato
+            offset, total_input_tokens, total_output_tokens = 0, 0, 0
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                walked = walk_json_messages(f)
+            transcript_format = 'jsonl' if walked is None else 'json'
+            if walked is not None:
+                offset = st.st_size
+                total_input_tokens, total_output_tokens = walked
+
+        if transcript_format == 'jsonl':
+            with open(transcript_path, 'rb') as f:
+                offset, new_input, new_output = scan_transcript_lines(f, offset)
+            total_input_tokens += new_input
+            total_output_tokens += new_output
     except:
         return None, None
 
+    cache[transcript_path] = {
+        'inode': st.st_ino,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'format': transcript_format,
+        'offset': offset,
+        'input': total_input_tokens,
+        'output': total_output_tokens,
+    }
+    save_transcript_cache(cache)
+
+    # El total usado es principalmente los input tokens (que incluyen el contexto)
+    return total_input_tokens, total_output_tokens
+
 def claude_usage_bar():
     """
     Función principal que Claude Code ejecuta para mostrar el status bar
@@ -139,13 +315,14 @@ def claude_usage_bar():
 
         data = json.loads(input_data)
 
-        # DEBUG: Guardar datos recibidos para análisis
-        debug_file = os.path.expanduser("~/.claude-code/statusbar-debug.json")
-        try:
-            with open(debug_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except:
-            pass
+        # DEBUG: Guardar datos recibidos para análisis (solo si se pide)
+        if os.environ.get("CLAUDE_STATUSBAR_PROFILE") == "1":
+            debug_file = os.path.expanduser("~/.claude-code/statusbar-debug.json")
+            try:
+                with open(debug_file, 'w') as f:
+                    json.dump(data, f, indent=2)
+            except:
+                pass
 
         # Extraer información del modelo
         model_info = data.get('model', {})
@@ -166,7 +343,8 @@ def claude_usage_bar():
         if transcript_path:
             input_tok, output_tok = get_token_usage_from_transcript(transcript_path)
             if input_tok:
-                usage_tokens = input_tok
+                # Misma definición que usage_bar.py: input + cache creation + output
+                usage_tokens = input_tok + (output_tok or 0)
 
         # Método 3: Usar campos directos si están disponibles
         if not usage_tokens:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# ~/.claude-code/scripts/usage_snapshot.py
+"""
+Lector del snapshot que publica usage_bar.py en ~/.claude-code/status.snap
+Mapea el archivo con mmap y arma una línea sin parsear JSON ni leer
+transcripts: pensado para tmux, polybar o el prompt del shell
+
+Uso:
+    python3 usage_snapshot.py                                   # "42% Resets: 15:00"
+    python3 usage_snapshot.py --format '{stale}{percentage}% {rate}/min'
+    python3 usage_snapshot.py --max-age 600                     # vacío si es más viejo
+
+Campos de --format: percentage, tokens, limit, reset, limit_at, rate,
+stale, mode, session, age
+"""
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+SNAPSHOT_PATH = os.path.join(os.path.expanduser("~"), ".claude-code", "status.snap")
+
+# Deben coincidir con SNAPSHOT_* de usage_bar.py
+SNAPSHOT_MAGIC = b"CSBS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHHQ")
+SNAPSHOT_BODY = struct.Struct("<ddddqqHHB3x40s")
+SNAPSHOT_STALE_USAGE = 1
+SNAPSHOT_STALE_RESET = 2
+USAGE_MODES = ("cumulative", "context", "block")
+
+# Reintentos si el snapshot se está escribiendo justo mientras se lee
+SNAPSHOT_RETRIES = 100
+STALE_GLYPH = "≈"
+DEFAULT_FORMAT = "{stale}{percentage}% Resets: {reset}"
+
+def map_snapshot(path=SNAPSHOT_PATH):
+    """
+    Mapea el snapshot en memoria (solo lectura) o retorna None
+    El escritor actualiza siempre el mismo archivo, así que un consumidor
+    residente puede conservar el mapeo y llamar a read_snapshot() en loop
+    """
+    try:
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), SNAPSHOT_HEADER.size + SNAPSHOT_BODY.size, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+def read_snapshot(mapped):
+    """
+    Lectura consistente (seqlock): retorna un dict con el estado o None
+    Si el contador es impar o cambió durante la lectura, se reintenta
+    """
+    for _ in range(SNAPSHOT_RETRIES):
+        magic, version, _, seq = SNAPSHOT_HEADER.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        if seq % 2 == 0:
+            values = SNAPSHOT_BODY.unpack_from(mapped, SNAPSHOT_HEADER.size)
+            if SNAPSHOT_HEADER.unpack_from(mapped, 0)[3] == seq:
+                break
+        time.sleep(0)
+    else:
+        return None
+
+    updated, reset, limit_at, burn_rate, tokens, limit, percentage, flags, mode, session_id = values
+    return {
+        'updated': updated,
+        'reset': None if math.isnan(reset) else reset,
+        'limit_at': None if math.isnan(limit_at) else limit_at,
+        'burn_rate': None if math.isnan(burn_rate) else burn_rate,
+        'tokens': tokens,
+        'limit': limit,
+        'percentage': percentage,
+        'stale_usage': bool(flags & SNAPSHOT_STALE_USAGE),
+        'stale_reset': bool(flags & SNAPSHOT_STALE_RESET),
+        'mode': USAGE_MODES[mode] if mode < len(USAGE_MODES) else None,
+        'session_id': session_id.rstrip(b"\0").decode('utf-8', 'replace'),
+    }
+
+def format_snapshot(snapshot, template=DEFAULT_FORMAT):
+    """Arma la línea con los campos del snapshot (ver docstring del módulo)"""
+    def clock(epoch):
+        return time.strftime('%H:%M', time.localtime(epoch)) if epoch is not None else ""
+
+    rate = snapshot['burn_rate']
+    return template.format(
+        percentage=snapshot['percentage'],
+        tokens=snapshot['tokens'],
+        limit=snapshot['limit'],
+        reset=clock(snapshot['reset']) or "--:--",
+        limit_at=clock(snapshot['limit_at']),
+        rate=f"{rate * 60:,.0f}" if rate is not None else "",
+        stale=STALE_GLYPH if snapshot['stale_usage'] or snapshot['stale_reset'] else "",
+        mode=snapshot['mode'] or "",
+        session=snapshot['session_id'][:8],
+        age=int(max(time.time() - snapshot['updated'], 0)),
+    )
+
+def main(argv):
+    template = DEFAULT_FORMAT
+    max_age = None
+    args = list(argv)
+    while args:
+        option = args.pop(0)
+        if option == "--format" and args:
+            template = args.pop(0)
+        elif option == "--max-age" and args:
+            max_age = float(args.pop(0))
+        else:
+            print(__doc__.strip(), file=sys.stderr)
+            return 2
+
+    mapped = map_snapshot()
+    snapshot = read_snapshot(mapped) if mapped is not None else None
+    if snapshot is None:
+        return 1
+    if max_age is not None and time.time() - snapshot['updated'] > max_age:
+        return 1
+
+    print(format_snapshot(snapshot, template))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))